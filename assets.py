@@ -0,0 +1,181 @@
+"""Loading and caching of the images and sounds of the GUI.
+
+The piece sprites and the check marker, which are needed for the first
+frame, are packed into a single atlas surface shared by all themes. Other
+sprites, theme boards and sounds are loaded on first use. Decoded and
+scaled surfaces are also kept in a disk cache as raw pixels, keyed by the
+modification times of their source files, which makes a restart much
+faster than decoding the PNG files again.
+"""
+import hashlib
+import json
+import os
+
+import pygame
+from pygame import mixer
+
+ASSET_ROOT = os.path.dirname(os.path.abspath(__file__))
+TILE_SIZE = 80
+
+SPRITE_FILES = {
+    'K_white': 'king_white.png', 'Q_white': 'queen_white.png',
+    'B_white': 'bishop_white.png', 'N_white': 'knight_white.png',
+    'R_white': 'rook_white.png', 'p_white': 'pawn_white.png',
+    'K_black': 'king_black.png', 'Q_black': 'queen_black.png',
+    'B_black': 'bishop_black.png', 'N_black': 'knight_black.png',
+    'R_black': 'rook_black.png', 'p_black': 'pawn_black.png',
+    'DK_white': 'king_white_dead.png', 'DK_black': 'king_black_dead.png',
+    'Check': 'check.png', 'Promotion': 'promotion.png',
+}
+# sprites packed into the atlas, in atlas order
+ATLAS_SPRITES = ('K_white', 'Q_white', 'B_white', 'N_white', 'R_white', 'p_white',
+                 'K_black', 'Q_black', 'B_black', 'N_black', 'R_black', 'p_black',
+                 'Check')
+SOUND_FILES = {'move': 'move.wav'}
+
+
+def default_cache_dir():
+    """Return the directory of the disk cache."""
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(cache_home, 'basic-chess')
+
+
+class AssetManager:
+    """Loads the images and sounds below ROOT, every file at most once.
+
+    Sprites are scaled to TILE_SIZE pixels and boards to eight tiles. A
+    CACHE_DIR of None disables the disk cache. The display mode must be set
+    before surfaces are requested.
+    """
+
+    def __init__(self, root=ASSET_ROOT, cache_dir=None, tile_size=TILE_SIZE):
+        """Create manager."""
+        self.root = root
+        self.cache_dir = cache_dir
+        self.tile_size = tile_size
+        self._themes = None
+        self._atlas = None
+        self._sprites = {}
+        self._boards = {}
+        self._sounds = {}
+
+    @property
+    def themes(self):
+        """Return the theme settings by theme name."""
+        if self._themes is None:
+            with open(os.path.join(self.root, 'img', 'themes.json')) as theme_file:
+                self._themes = json.load(theme_file)
+        return self._themes
+
+    def theme(self, name):
+        """Return the settings of theme NAME."""
+        try:
+            return self.themes[name]
+        except KeyError:
+            raise ValueError(f"Unknown theme `{name}`.") from None
+
+    def board(self, theme):
+        """Return the board image of THEME."""
+        board = self._boards.get(theme)
+        if board is None:
+            size = 8 * self.tile_size
+            board = self._load([os.path.join('img', self.theme(theme)['filename'])],
+                               (size, size), alpha=False)
+            self._boards[theme] = board
+        return board
+
+    def sprite(self, name):
+        """Return the sprite NAME, see SPRITE_FILES."""
+        sprite = self._sprites.get(name)
+        if sprite is not None:
+            return sprite
+        if name not in SPRITE_FILES:
+            raise ValueError(f"Unknown sprite `{name}`.")
+        if name in ATLAS_SPRITES:
+            atlas = self.atlas()
+            index = ATLAS_SPRITES.index(name)
+            sprite = atlas.subsurface((index * self.tile_size, 0,
+                                       self.tile_size, self.tile_size))
+        else:
+            sprite = self._load([os.path.join('img', SPRITE_FILES[name])],
+                                (self.tile_size, self.tile_size))
+        self._sprites[name] = sprite
+        return sprite
+
+    def atlas(self):
+        """Return the surface with the ATLAS_SPRITES side by side."""
+        if self._atlas is None:
+            self._atlas = self._load([os.path.join('img', SPRITE_FILES[name])
+                                      for name in ATLAS_SPRITES],
+                                     (len(ATLAS_SPRITES) * self.tile_size, self.tile_size))
+        return self._atlas
+
+    def sound(self, name):
+        """Return the sound NAME, see SOUND_FILES."""
+        sound = self._sounds.get(name)
+        if sound is None:
+            sound = mixer.Sound(os.path.join(self.root, 'snd', SOUND_FILES[name]))
+            self._sounds[name] = sound
+        return sound
+
+    def _load(self, filenames, size, alpha=True):
+        """Return the images FILENAMES scaled to tiles side by side in SIZE.
+
+        The result comes from the disk cache if the files have not changed.
+        """
+        paths = [os.path.join(self.root, filename) for filename in filenames]
+        cache_path = self._cache_path(paths, size, alpha)
+        surface = None
+        if cache_path is not None:
+            try:
+                with open(cache_path, 'rb') as cache_file:
+                    surface = pygame.image.frombuffer(cache_file.read(), size, 'RGBA')
+            except (OSError, ValueError):
+                surface = None
+        if surface is None:
+            surface = self._compose(paths, size)
+            if cache_path is not None:
+                self._store(cache_path, surface)
+        return surface.convert_alpha() if alpha else surface.convert()
+
+    def _compose(self, paths, size):
+        """Decode and scale the images PATHS into a surface of SIZE."""
+        surface = pygame.Surface(size, pygame.SRCALPHA)
+        width = size[0] // len(paths)
+        for index, path in enumerate(paths):
+            try:
+                image = pygame.image.load(path)
+            except (pygame.error, FileNotFoundError):
+                raise SystemExit(f"Could not load image \"{path}\" {pygame.get_error()}")
+            if image.get_size() != (width, size[1]):
+                image = pygame.transform.smoothscale(image.convert_alpha(), (width, size[1]))
+            surface.blit(image, (index * width, 0))
+        return surface
+
+    def _cache_path(self, paths, size, alpha):
+        """Return the cache file for the images PATHS, None without a cache."""
+        if self.cache_dir is None:
+            return None
+        key = hashlib.sha1(repr((size, alpha)).encode())
+        for path in paths:
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                return None
+            key.update(f"{path}\0{mtime}\0".encode())
+        return os.path.join(self.cache_dir, key.hexdigest() + '.rgba')
+
+    @staticmethod
+    def _store(cache_path, surface):
+        """Write the pixels of SURFACE to the disk cache, ignoring failures."""
+        temporary = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(temporary, 'wb') as cache_file:
+                cache_file.write(pygame.image.tostring(surface, 'RGBA'))
+            os.replace(temporary, cache_path)
+        except OSError:
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
@@ -0,0 +1,202 @@
+"""Evaluation of many positions at once with numpy.
+
+A batch of N positions is kept as an ``(N, 12)`` array of ``uint64``
+bitboards, one per color and piece in ``PLANES`` order, and an ``(N,)``
+boolean array that is True where white is to move. All functions work on
+the whole batch without looping over positions in python.
+"""
+import numpy as np
+
+from chessboard import PIECE_TYPES
+from evaluation import SQUARE_VALUES
+
+COLORS = ('white', 'black')
+# (color, piece) of every plane
+PLANES = tuple((color, kind) for color in COLORS for kind in PIECE_TYPES)
+FEN_PLANES = {(kind.upper() if color == 'white' else kind.lower()): index
+              for index, (color, kind) in enumerate(PLANES)}
+
+# material plus piece-square value per plane and square, negative for black
+_SQUARE_VALUES = np.array([SQUARE_VALUES[color][kind] for color, kind in PLANES],
+                          dtype=np.int32)
+_SQUARE_VALUES[6:] *= -1
+# summed values of the fields set in every byte value, per plane and row
+_BITS = (np.arange(256)[:, None] >> np.arange(8)) & 1
+_ROW_VALUES = np.einsum('vb,prb->prv', _BITS, _SQUARE_VALUES.reshape(12, 8, 8))
+_PLANE_INDEX = np.arange(12)[:, None]
+_ROW_INDEX = np.arange(8)
+
+_FILE_A = np.uint64(0x0101010101010101)
+_NOT_A = ~_FILE_A
+_NOT_H = ~(_FILE_A << np.uint64(7))
+_NOT_AB = _NOT_A & ~(_FILE_A << np.uint64(1))
+_NOT_GH = _NOT_H & ~(_FILE_A << np.uint64(6))
+_RANK_3 = np.uint64(0xFF << 16)
+_RANK_6 = np.uint64(0xFF << 40)
+_ZERO = np.uint64(0)
+
+# (shift, mask of squares that may be left) for rook and bishop directions,
+# a positive shift moves towards higher squares
+_ROOK_DIRECTIONS = ((8, ~_ZERO), (-8, ~_ZERO), (1, _NOT_A), (-1, _NOT_H))
+_BISHOP_DIRECTIONS = ((9, _NOT_A), (7, _NOT_H), (-7, _NOT_A), (-9, _NOT_H))
+_KNIGHT_STEPS = ((17, _NOT_A), (15, _NOT_H), (10, _NOT_AB), (6, _NOT_GH),
+                 (-6, _NOT_AB), (-10, _NOT_GH), (-15, _NOT_A), (-17, _NOT_H))
+_KING_STEPS = _ROOK_DIRECTIONS + _BISHOP_DIRECTIONS
+
+
+def from_boards(boards):
+    """Return the bitboards and side to move of a sequence of ChessBoards."""
+    bitboards = np.array([[board.bitboards[color][kind] for color, kind in PLANES]
+                          for board in boards], dtype=np.uint64).reshape(-1, 12)
+    white_to_move = np.array([board.turn == 'white' for board in boards], dtype=bool)
+    return bitboards, white_to_move
+
+
+def from_fens(fens):
+    """Return the bitboards and side to move of a sequence of FEN strings.
+
+    Only the piece placement and the side to move are read, which is much
+    faster than creating a ChessBoard per position.
+    """
+    rows = []
+    turns = []
+    for fen in fens:
+        placement, turn = fen.split(None, 2)[:2]
+        masks = [0] * 12
+        sq = 56
+        for char in placement:
+            if char == '/':
+                sq -= 16
+            elif char.isdigit():
+                sq += int(char)
+            else:
+                masks[FEN_PLANES[char]] |= 1 << sq
+                sq += 1
+        rows.append(masks)
+        turns.append(turn == 'w')
+    return (np.array(rows, dtype=np.uint64).reshape(-1, 12),
+            np.array(turns, dtype=bool))
+
+
+def to_planes(bitboards):
+    """Convert bitboards into an ``(N, 12, 8, 8)`` array of 0 and 1.
+
+    ``planes[n, plane, row, col]`` is 1 if the piece of the plane is on
+    field (row, col) of position n, row 0 being the first row.
+    """
+    squares = np.unpackbits(bitboards.astype('<u8').view(np.uint8), axis=-1,
+                            bitorder='little')
+    return squares.reshape(-1, 12, 8, 8)
+
+
+def evaluate(bitboards, white_to_move):
+    """Score the positions in centipawns for the side to move.
+
+    Gives the same scores as ``evaluation.evaluate``.
+    """
+    # every byte of a bitboard is a row, look up the value of its fields
+    rows = bitboards.astype('<u8').view(np.uint8).reshape(-1, 12, 8)
+    scores = _ROW_VALUES[_PLANE_INDEX, _ROW_INDEX, rows].sum(axis=(1, 2))
+    return np.where(white_to_move, scores, -scores)
+
+
+def attack_maps(bitboards):
+    """Return the ``(N, 2)`` bitboards of the fields attacked by each color."""
+    occupied = np.bitwise_or.reduce(bitboards, axis=1)
+    maps = []
+    for offset, color in ((0, 'white'), (6, 'black')):
+        pawns, knights, bishops, rooks, queens, king = (
+            bitboards[:, offset + index] for index in range(6))
+        attacks = _pawn_attacks(pawns, color)
+        for shift, mask in _KNIGHT_STEPS:
+            attacks |= _shift(knights, shift, mask)
+        for shift, mask in _KING_STEPS:
+            attacks |= _shift(king, shift, mask)
+        for shift, mask in _ROOK_DIRECTIONS:
+            attacks |= _slide(rooks | queens, occupied, shift, mask)
+        for shift, mask in _BISHOP_DIRECTIONS:
+            attacks |= _slide(bishops | queens, occupied, shift, mask)
+        maps.append(attacks)
+    return np.stack(maps, axis=1)
+
+
+def attack_counts(bitboards):
+    """Return the ``(N, 2)`` number of fields attacked by each color."""
+    return popcount(attack_maps(bitboards))
+
+
+def mobility(bitboards):
+    """Return the ``(N, 2)`` number of pseudo-legal moves of each color.
+
+    Moves that leave the king in check are included, en passant and
+    castling are not, and a promotion counts as one move.
+    """
+    occupied = np.bitwise_or.reduce(bitboards, axis=1)
+    counts = []
+    for offset, color in ((0, 'white'), (6, 'black')):
+        own = np.bitwise_or.reduce(bitboards[:, offset:offset + 6], axis=1)
+        enemy = occupied & ~own
+        targets = ~own
+        pawns, knights, bishops, rooks, queens, king = (
+            bitboards[:, offset + index] for index in range(6))
+        # pieces never share targets in a single direction, so the moves
+        # are counted per direction over all pieces at once
+        if color == 'white':
+            pushes = (pawns << np.uint64(8)) & ~occupied
+            double_pushes = ((pushes & _RANK_3) << np.uint64(8)) & ~occupied
+            captures = ((pawns << np.uint64(9)) & _NOT_A & enemy,
+                        (pawns << np.uint64(7)) & _NOT_H & enemy)
+        else:
+            pushes = (pawns >> np.uint64(8)) & ~occupied
+            double_pushes = ((pushes & _RANK_6) >> np.uint64(8)) & ~occupied
+            captures = ((pawns >> np.uint64(7)) & _NOT_A & enemy,
+                        (pawns >> np.uint64(9)) & _NOT_H & enemy)
+        count = popcount(pushes) + popcount(double_pushes)
+        for pawn_captures in captures:
+            count += popcount(pawn_captures)
+        for shift, mask in _KNIGHT_STEPS:
+            count += popcount(_shift(knights, shift, mask) & targets)
+        for shift, mask in _KING_STEPS:
+            count += popcount(_shift(king, shift, mask) & targets)
+        for shift, mask in _ROOK_DIRECTIONS:
+            count += popcount(_slide(rooks | queens, occupied, shift, mask) & targets)
+        for shift, mask in _BISHOP_DIRECTIONS:
+            count += popcount(_slide(bishops | queens, occupied, shift, mask) & targets)
+        counts.append(count)
+    return np.stack(counts, axis=1)
+
+
+def popcount(bitboards):
+    """Count the set bits of every element of a ``uint64`` array."""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(bitboards).astype(np.int32)
+    # numpy < 2.0
+    counts = bitboards - ((bitboards >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    counts = ((counts & np.uint64(0x3333333333333333))
+              + ((counts >> np.uint64(2)) & np.uint64(0x3333333333333333)))
+    counts = (counts + (counts >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return ((counts * np.uint64(0x0101010101010101)) >> np.uint64(56)).astype(np.int32)
+
+
+def _shift(bitboards, shift, mask):
+    """Shift bitboards by SHIFT squares, dropping fields that wrap around."""
+    if shift > 0:
+        return (bitboards << np.uint64(shift)) & mask
+    return (bitboards >> np.uint64(-shift)) & mask
+
+
+def _slide(sliders, occupied, shift, mask):
+    """Return the fields attacked by SLIDERS in one direction (Kogge-Stone)."""
+    empty = ~occupied & mask
+    sliders = sliders.copy()
+    for step in (shift, 2 * shift, 4 * shift):
+        sliders |= empty & _shift(sliders, step, ~_ZERO)
+        empty &= _shift(empty, step, ~_ZERO)
+    return _shift(sliders, shift, mask)
+
+
+def _pawn_attacks(pawns, color):
+    """Return the fields attacked by PAWNS of COLOR."""
+    if color == 'white':
+        return _shift(pawns, 9, _NOT_A) | _shift(pawns, 7, _NOT_H)
+    return _shift(pawns, -7, _NOT_A) | _shift(pawns, -9, _NOT_H)
@@ -0,0 +1,49 @@
+"""Search benchmark.
+
+Searches the perft test positions to a fixed depth and reports the number
+of nodes, which measures the move ordering, and the search speed. Run:
+
+    $ python bench.py --depth 5
+"""
+import argparse
+import time
+
+from chessboard import ChessBoard
+from engine import Engine
+from ordering import MoveOrderer
+from perft import POSITIONS
+
+
+def run(depth, ordering_options, quiescence=True):
+    """Search all positions to DEPTH, return total nodes and seconds."""
+    total_nodes = 0
+    start = time.perf_counter()
+    for name, fen, _ in POSITIONS:
+        engine = Engine(depth, ordering=MoveOrderer(**ordering_options),
+                        quiescence=quiescence)
+        result = engine.search(ChessBoard.from_fen(fen))
+        total_nodes += result.nodes
+        print(f"{name}: {result}")
+    elapsed = time.perf_counter() - start
+    print(f"total: {total_nodes} nodes {elapsed:.3f} s "
+          f"{total_nodes / max(elapsed, 1e-9):.0f} nps")
+    return total_nodes, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--depth', type=int, default=4, help="search depth")
+    parser.add_argument('--no-mvv-lva', action='store_true',
+                        help="do not order captures by victim and attacker")
+    parser.add_argument('--no-killers', action='store_true', help="do not use killer moves")
+    parser.add_argument('--no-history', action='store_true',
+                        help="do not use the history heuristic")
+    parser.add_argument('--no-quiescence', action='store_true',
+                        help="evaluate the leaves without searching captures")
+    args = parser.parse_args()
+    run(args.depth, {'mvv_lva': not args.no_mvv_lva, 'killers': not args.no_killers,
+                     'history': not args.no_history}, not args.no_quiescence)
+
+
+if __name__ == '__main__':
+    main()
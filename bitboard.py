@@ -0,0 +1,194 @@
+"""Bitboard primitives.
+
+Squares are numbered from 0 to 63 with ``square = row * 8 + col``, so the
+board position ``(0, 0)`` (a1) is square 0 and ``(7, 7)`` (h8) is square 63.
+A bitboard is a plain python int in which bit ``square`` is set for every
+square in the set.
+"""
+
+FULL = (1 << 64) - 1
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+RANK_1 = 0xFF
+RANK_8 = RANK_1 << 56
+DARK_SQUARES = 0xAA55AA55AA55AA55
+LIGHT_SQUARES = ~DARK_SQUARES & FULL
+
+BIT = [1 << sq for sq in range(64)]
+# (row, col) position of every square, shared instead of building new tuples
+POSITIONS = [(sq >> 3, sq & 7) for sq in range(64)]
+
+
+def to_square(position):
+    """Convert a (row, col) position into a square index."""
+    return position[0] * 8 + position[1]
+
+
+def to_position(sq):
+    """Convert a square index into a (row, col) position."""
+    return sq >> 3, sq & 7
+
+
+def lsb(mask):
+    """Return the index of the least significant set bit."""
+    return (mask & -mask).bit_length() - 1
+
+
+def msb(mask):
+    """Return the index of the most significant set bit."""
+    return mask.bit_length() - 1
+
+
+def popcount(mask):
+    """Count the number of set bits."""
+    return bin(mask).count('1')
+
+
+def iter_squares(mask):
+    """Yield the square indices of all set bits, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def positions(mask):
+    """Return the (row, col) positions of all set bits."""
+    return [to_position(sq) for sq in iter_squares(mask)]
+
+
+def _step_mask(sq, steps):
+    """Build the mask of squares reached from SQ by single STEPS."""
+    row, col = to_position(sq)
+    mask = 0
+    for d_row, d_col in steps:
+        if 0 <= row + d_row < 8 and 0 <= col + d_col < 8:
+            mask |= BIT[(row + d_row) * 8 + col + d_col]
+    return mask
+
+
+def _ray_mask(sq, d_row, d_col):
+    """Build the mask of squares from SQ in a direction, excluding SQ."""
+    row, col = to_position(sq)
+    mask = 0
+    row += d_row
+    col += d_col
+    while 0 <= row < 8 and 0 <= col < 8:
+        mask |= BIT[row * 8 + col]
+        row += d_row
+        col += d_col
+    return mask
+
+
+KNIGHT_ATTACKS = [_step_mask(sq, [(1, 2), (2, 1), (2, -1), (1, -2),
+                                  (-1, -2), (-2, -1), (-2, 1), (-1, 2)])
+                  for sq in range(64)]
+KING_ATTACKS = [_step_mask(sq, [(1, 0), (1, 1), (0, 1), (-1, 1),
+                                (-1, 0), (-1, -1), (0, -1), (1, -1)])
+                for sq in range(64)]
+PAWN_ATTACKS = {
+    'white': [_step_mask(sq, [(1, -1), (1, 1)]) for sq in range(64)],
+    'black': [_step_mask(sq, [(-1, -1), (-1, 1)]) for sq in range(64)],
+}
+PAWN_PUSHES = {
+    'white': [_step_mask(sq, [(1, 0)]) for sq in range(64)],
+    'black': [_step_mask(sq, [(-1, 0)]) for sq in range(64)],
+}
+
+# rays in which the square index increases or decreases along the ray
+NORTH = [_ray_mask(sq, 1, 0) for sq in range(64)]
+EAST = [_ray_mask(sq, 0, 1) for sq in range(64)]
+SOUTH = [_ray_mask(sq, -1, 0) for sq in range(64)]
+WEST = [_ray_mask(sq, 0, -1) for sq in range(64)]
+NORTH_EAST = [_ray_mask(sq, 1, 1) for sq in range(64)]
+NORTH_WEST = [_ray_mask(sq, 1, -1) for sq in range(64)]
+SOUTH_EAST = [_ray_mask(sq, -1, 1) for sq in range(64)]
+SOUTH_WEST = [_ray_mask(sq, -1, -1) for sq in range(64)]
+
+# squares reached on an empty board
+ROOK_RAYS = [NORTH[sq] | EAST[sq] | SOUTH[sq] | WEST[sq] for sq in range(64)]
+BISHOP_RAYS = [NORTH_EAST[sq] | NORTH_WEST[sq] | SOUTH_EAST[sq] | SOUTH_WEST[sq]
+               for sq in range(64)]
+QUEEN_RAYS = [ROOK_RAYS[sq] | BISHOP_RAYS[sq] for sq in range(64)]
+
+
+def rook_attacks(sq, occupied):
+    """Return the squares attacked by a rook on SQ given the occupancy."""
+    # every ray is cut off behind its first blocker
+    attacks = NORTH[sq]
+    blockers = attacks & occupied
+    if blockers:
+        attacks ^= NORTH[(blockers & -blockers).bit_length() - 1]
+    ray = EAST[sq]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= EAST[(blockers & -blockers).bit_length() - 1]
+    attacks |= ray
+    ray = SOUTH[sq]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= SOUTH[blockers.bit_length() - 1]
+    attacks |= ray
+    ray = WEST[sq]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= WEST[blockers.bit_length() - 1]
+    return attacks | ray
+
+
+def bishop_attacks(sq, occupied):
+    """Return the squares attacked by a bishop on SQ given the occupancy."""
+    attacks = NORTH_EAST[sq]
+    blockers = attacks & occupied
+    if blockers:
+        attacks ^= NORTH_EAST[(blockers & -blockers).bit_length() - 1]
+    ray = NORTH_WEST[sq]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= NORTH_WEST[(blockers & -blockers).bit_length() - 1]
+    attacks |= ray
+    ray = SOUTH_EAST[sq]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= SOUTH_EAST[blockers.bit_length() - 1]
+    attacks |= ray
+    ray = SOUTH_WEST[sq]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= SOUTH_WEST[blockers.bit_length() - 1]
+    return attacks | ray
+
+
+def queen_attacks(sq, occupied):
+    """Return the squares attacked by a queen on SQ given the occupancy."""
+    return rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
+
+
+def pawn_attack_mask(pawns, color):
+    """Return all squares attacked by a set of pawns of COLOR."""
+    if color == 'white':
+        return (((pawns << 7) & ~FILE_H) | ((pawns << 9) & ~FILE_A)) & FULL
+    return ((pawns >> 9) & ~FILE_H) | ((pawns >> 7) & ~FILE_A)
+
+
+def _between_and_line(a, b):
+    """Build the masks between and through squares A and B."""
+    row_a, col_a = to_position(a)
+    row_b, col_b = to_position(b)
+    d_row = row_b - row_a
+    d_col = col_b - col_a
+    if a == b or (d_row and d_col and abs(d_row) != abs(d_col)):
+        return 0, 0
+    d_row = (d_row > 0) - (d_row < 0)
+    d_col = (d_col > 0) - (d_col < 0)
+    between = _ray_mask(a, d_row, d_col) & _ray_mask(b, -d_row, -d_col)
+    line = _ray_mask(a, d_row, d_col) | _ray_mask(a, -d_row, -d_col) | BIT[a]
+    return between, line
+
+
+_MASKS = [[_between_and_line(a, b) for b in range(64)] for a in range(64)]
+# squares strictly between two squares on a common line, else 0
+BETWEEN = [[between for between, _ in row] for row in _MASKS]
+# the full line through two squares on a common line, else 0
+LINE = [[line for _, line in row] for row in _MASKS]
+del _MASKS
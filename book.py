@@ -0,0 +1,205 @@
+"""Opening books in the Polyglot format.
+
+A Polyglot book is a file of 16 byte entries sorted by position key: the
+key (``ChessBoard.hash`` is the Polyglot key), a move, a weight and a
+learn value, all big-endian. Books are memory-mapped, so they are read
+without loading them and worker processes share the pages of a book.
+Build a book from PGN files with:
+
+    $ python book.py games.pgn --output book.bin --plies 16
+"""
+import argparse
+import mmap
+import random
+import struct
+
+import pgn
+from chessmove import CASTLE, PROMOTION_MASK
+
+ENTRY = struct.Struct('>QHHI')
+KEY = struct.Struct('>Q')
+MAX_WEIGHT = 0xFFFF
+# weight of a move per point the moving side scored with it
+RESULT_WEIGHTS = {'1-0': (2, 0), '0-1': (0, 2), '1/2-1/2': (1, 1)}
+
+
+def polyglot_move(move):
+    """Convert an encoded move into a Polyglot move.
+
+    Polyglot moves have the same from, to and promotion bits, except that
+    castling is written as the king taking its own rook.
+    """
+    from_sq = move & 63
+    to_sq = (move >> 6) & 63
+    if move & CASTLE:
+        # the rook in the corner on the side the king moves to
+        to_sq = (to_sq & ~7) | (7 if to_sq > from_sq else 0)
+    return to_sq | from_sq << 6 | move & PROMOTION_MASK
+
+
+class OpeningBook:
+    """A memory-mapped Polyglot opening book.
+
+    Books are closed with ``close`` or by using them as a context manager.
+    SEED makes the choice of weighted random moves reproducible.
+    """
+
+    def __init__(self, filename, seed=None):
+        """Open the book FILENAME."""
+        self.filename = filename
+        self.random = random.Random(seed)
+        with open(filename, 'rb') as book_file:
+            try:
+                self._data = mmap.mmap(book_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # an empty file can not be mapped
+                self._data = b''
+        self.size = len(self._data) // ENTRY.size
+
+    def close(self):
+        """Unmap the book."""
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = b''
+        self.size = 0
+
+    def __enter__(self):
+        """Enter context."""
+        return self
+
+    def __exit__(self, *args):
+        """Exit context and close the book."""
+        self.close()
+
+    def __len__(self):
+        """Return the number of entries."""
+        return self.size
+
+    def __getstate__(self):
+        """Pickle the file name only, the book is mapped again when loaded."""
+        return self.filename
+
+    def __setstate__(self, filename):
+        """Map the book again after unpickling."""
+        self.__init__(filename)
+
+    def entries(self, key):
+        """Yield the (Polyglot move, weight) entries of position KEY."""
+        data = self._data
+        # binary search of the first entry of the key
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(data, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        for index in range(low, self.size):
+            entry_key, move, weight, _ = ENTRY.unpack_from(data, index * ENTRY.size)
+            if entry_key != key:
+                break
+            yield move, weight
+
+    def moves(self, board):
+        """Return the (encoded move, weight) book moves for BOARD.
+
+        Only legal moves are returned, the best weighted first.
+        """
+        entries = dict(self.entries(board.hash))
+        if not entries:
+            return []
+        moves = []
+        for move in board.generate_legal_moves(board.turn):
+            weight = entries.get(polyglot_move(move))
+            if weight is not None:
+                moves.append((move, weight))
+        moves.sort(key=lambda item: item[1], reverse=True)
+        return moves
+
+    def choose(self, board, weighted=True):
+        """Return a book move for BOARD or None if it is not in the book.
+
+        The move is chosen at random with a probability proportional to its
+        weight, or without WEIGHTED the best weighted move is taken.
+        """
+        moves = [(move, weight) for move, weight in self.moves(board) if weight]
+        if not moves:
+            return None
+        if not weighted:
+            return moves[0][0]
+        pick = self.random.randrange(sum(weight for _, weight in moves))
+        for move, weight in moves:
+            pick -= weight
+            if pick < 0:
+                return move
+        return moves[-1][0]
+
+
+def build(pgn_files, output, plies=16, min_games=1):
+    """Write a book of the first PLIES half moves of the games in PGN_FILES.
+
+    A move gets 2 points per win and 1 per draw of the side that played
+    it. Moves played in fewer than MIN_GAMES games or that never scored
+    are left out. Returns the number of entries.
+    """
+    # (key, Polyglot move) -> [weight, games]
+    stats = {}
+    for filename in pgn_files:
+        for game in pgn.read_games(filename):
+            weights = RESULT_WEIGHTS.get(game.result, (0, 0))
+            board = game.board()
+            try:
+                for entry, color in _book_moves(game, board, plies):
+                    item = stats.setdefault(entry, [0, 0])
+                    item[0] += weights[color]
+                    item[1] += 1
+            except ValueError:
+                # keep the moves up to an illegal one
+                continue
+
+    # scale the weights of a position to fit into 16 bits
+    positions = {}
+    for (key, move), (weight, games) in stats.items():
+        if games >= min_games and weight:
+            positions.setdefault(key, []).append((move, weight))
+    count = 0
+    with open(output, 'wb') as book_file:
+        for key in sorted(positions):
+            moves = positions[key]
+            top = max(weight for _, weight in moves)
+            scale = min(1.0, MAX_WEIGHT / top)
+            moves.sort(key=lambda item: item[1], reverse=True)
+            for move, weight in moves:
+                book_file.write(ENTRY.pack(key, move, max(1, int(weight * scale)), 0))
+                count += 1
+    return count
+
+
+def _book_moves(game, board, plies):
+    """Yield ((key, Polyglot move), color index) of the first PLIES moves.
+
+    Raises ValueError on an illegal move.
+    """
+    for ply, san in enumerate(game.moves):
+        if ply >= plies:
+            break
+        move = board.parse_san(san)
+        yield (board.hash, polyglot_move(move)), 0 if board.turn == 'white' else 1
+        board.make_move(move)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a Polyglot opening book.")
+    parser.add_argument('pgn', nargs='+', help="PGN files with the games")
+    parser.add_argument('--output', default='book.bin', help="book file to write")
+    parser.add_argument('--plies', type=int, default=16,
+                        help="half moves of every game to add")
+    parser.add_argument('--min-games', type=int, default=1,
+                        help="leave out moves played in fewer games")
+    args = parser.parse_args()
+    count = build(args.pgn, args.output, args.plies, args.min_games)
+    print(f"{count} entries written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,25 +1,66 @@
 """A chess board."""
 
-import numpy as np
-from util import on_board, is_even
+import re
+
+from bitboard import (BETWEEN, BIT, DARK_SQUARES, FILE_A, FULL, KING_ATTACKS,
+                      KNIGHT_ATTACKS, LIGHT_SQUARES, LINE, PAWN_ATTACKS,
+                      POSITIONS, RANK_1, bishop_attacks, iter_squares, lsb,
+                      pawn_attack_mask, positions, queen_attacks, rook_attacks,
+                      to_position, to_square)
+from chesspiece import Bishop, King, Knight, Pawn, Queen, Rook
+from chessmove import (CAPTURE, CASTLE, DOUBLE_PUSH, EN_PASSANT,
+                       PROMOTION_CODES, PROMOTION_PIECES, encode, move_name)
+from evaluation import PIECE_VALUES
+from util import is_even
+from zobrist import (BLACK_KING_SIDE, BLACK_QUEEN_SIDE, CASTLING_KEYS,
+                     EN_PASSANT_KEYS, PIECE_KEYS, TURN_KEY, WHITE_KING_SIDE,
+                     WHITE_QUEEN_SIDE)
+
+PIECE_TYPES = ('p', 'N', 'B', 'R', 'Q', 'K')
+PIECE_CLASSES = {'p': Pawn, 'N': Knight, 'B': Bishop, 'R': Rook, 'Q': Queen,
+                 'K': King}
+PROMOTION_CLASSES = (None, Knight, Bishop, Rook, Queen)
+
+# castling rights bit, color, king position and rook position
+CASTLING = ((WHITE_KING_SIDE, 'white', (0, 4), (0, 7)),
+            (WHITE_QUEEN_SIDE, 'white', (0, 4), (0, 0)),
+            (BLACK_KING_SIDE, 'black', (7, 4), (7, 7)),
+            (BLACK_QUEEN_SIDE, 'black', (7, 4), (7, 0)))
+CASTLING_CHARS = ((WHITE_KING_SIDE, 'K'), (WHITE_QUEEN_SIDE, 'Q'),
+                  (BLACK_KING_SIDE, 'k'), (BLACK_QUEEN_SIDE, 'q'))
+# piece values for exchanges, the king can only be taken last
+SEE_VALUES = dict(PIECE_VALUES, K=20000)
+SEE_ORDER = ('p', 'N', 'B', 'R', 'Q', 'K')
+# castling, piece, from column, from row, to field and promotion of a SAN move
+SAN_PATTERN = re.compile(r'^(?:([O0]-[O0](?:-[O0])?)|([NBRQK])?([a-h])?([1-8])?'
+                         r'x?([a-h][1-8])(?:=?([NBRQ]))?)[+#]?[!?]*$')
+# fields on which a change of piece may change the castling rights
+CASTLING_FIELDS = 0
+for _, _, _king_pos, _rook_pos in CASTLING:
+    CASTLING_FIELDS |= BIT[to_square(_king_pos)] | BIT[to_square(_rook_pos)]
 
 
 class Field:
     """Keep state of field on the board."""
 
+    __slots__ = ('color', 'contents')
+
     def __init__(self, color):
         """Initialize."""
         if color not in ['white', 'black']:
             raise ValueError("Wrong color!")
         self.color = color
-        self.occupied = False
         self.contents = None
-    
+
+    @property
+    def occupied(self):
+        """Test if a piece is on the field."""
+        return self.contents is not None
+
     def set(self, piece):
         """Set piece on field."""
         self.contents = piece
-        self.occupied = True
-    
+
     def get(self):
         """Get contents."""
         return self.contents
@@ -27,11 +68,20 @@ class Field:
     def empty(self):
         """Remove contents."""
         self.contents = None
-        self.occupied = False
 
 
 class ChessBoard:
-    """Keep state of chessboard."""
+    """Keep state of chessboard.
+
+    Besides the 8x8 grid of fields, the board keeps a bitboard per color and
+    piece type. All attack and legality questions are answered from these
+    bitboards, see the ``bitboard`` module.
+
+    ``hash`` is the Zobrist hash of the position, see the ``zobrist`` module.
+    It is updated incrementally by ``set`` and ``make_move``.
+    """
+
+    col_names = ('a', 'b', 'c', 'd', 'e', 'f', 'g', 'h')
 
     def __init__(self, row_size=8, col_size=8):
         """Create instance."""
@@ -39,159 +89,481 @@ class ChessBoard:
         self.col_size = col_size
 
         self.flag_castle = False
-        self.en_passant_pieces = []
+        self.ep_square = None
         self.promotion = None
-        self.col_names = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
+        self.turn = 'white'
+        self.undo_stack = []
+        self.castling_rights = 0
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        # attack maps per color, computed on demand, see attacked_squares
+        self._attacked = {'white': None, 'black': None}
+        # Zobrist hash of the (empty) position with white to move
+        self.hash = TURN_KEY
         self.king_positions = {'white': None, 'black': None}
 
+        self.bitboards = {'white': dict.fromkeys(PIECE_TYPES, 0),
+                          'black': dict.fromkeys(PIECE_TYPES, 0)}
+        self.occupancy = {'white': 0, 'black': 0}
+
         self.board = [[Field('black') if is_even(i + j) else Field('white')
                        for j in range(row_size)]
                       for i in range(col_size)]
 
+    def __getstate__(self):
+        """Return a compact state for pickling.
+
+        Only the position is kept: a bitboard per color and piece type, the
+        side to move, castling rights, en passant square and move counters.
+        """
+        return (tuple(self.bitboards['white'][kind] for kind in PIECE_TYPES),
+                tuple(self.bitboards['black'][kind] for kind in PIECE_TYPES),
+                self.turn, self.castling_rights, self.ep_square,
+                self.halfmove_clock, self.fullmove_number)
+
+    def __setstate__(self, state):
+        """Restore the position from a state made by __getstate__."""
+        self.__init__()
+        white, black = state[:2]
+        for color, masks in (('white', white), ('black', black)):
+            for kind, mask in zip(PIECE_TYPES, masks):
+                for sq in iter_squares(mask):
+                    self._put(PIECE_CLASSES[kind](color, POSITIONS[sq]), sq)
+        self.setup_state(*state[2:])
+
+    @classmethod
+    def from_fen(cls, fen):
+        """Create a board from a FEN string."""
+        fields = fen.split()
+        if len(fields) not in (4, 6):
+            raise ValueError(f"Invalid FEN `{fen}`.")
+        placement, turn, castling, ep_field = fields[:4]
+        rows = placement.split('/')
+        if len(rows) != 8 or turn not in ('w', 'b'):
+            raise ValueError(f"Invalid FEN `{fen}`.")
+
+        board = cls()
+        for i, row_str in enumerate(rows):
+            row = 7 - i
+            col = 0
+            for char in row_str:
+                if char.isdigit():
+                    col += int(char)
+                    continue
+                kind = char.upper() if char.lower() != 'p' else 'p'
+                if kind not in PIECE_CLASSES or col > 7:
+                    raise ValueError(f"Invalid FEN `{fen}`.")
+                color = 'white' if char.isupper() else 'black'
+                board._put(PIECE_CLASSES[kind](color, POSITIONS[row * 8 + col]),
+                           row * 8 + col)
+                col += 1
+            if col != 8:
+                raise ValueError(f"Invalid FEN `{fen}`.")
+
+        castling_rights = 0
+        for right, char in CASTLING_CHARS:
+            if char in castling:
+                castling_rights |= right
+        ep_square = None
+        if ep_field != '-':
+            # the field behind a pawn of the opponent that was just pushed
+            # two fields, which passed the en passant field
+            if (len(ep_field) != 2 or ep_field[0] not in board.col_names
+                    or ep_field[1] != ('6' if turn == 'w' else '3')):
+                raise ValueError(f"Invalid FEN `{fen}`.")
+            col = board.col_names.index(ep_field[0])
+            row = int(ep_field[1]) - 1
+            step = -1 if turn == 'w' else 1
+            pushed = board.board[row + step][col].contents
+            if (pushed is None or pushed.short_name != 'p'
+                    or pushed.color == ('white' if turn == 'w' else 'black')
+                    or board.board[row][col].occupied
+                    or board.board[row - step][col].occupied):
+                raise ValueError(f"Invalid FEN `{fen}`.")
+            ep_square = to_square((row, col))
+        counters = [int(value) for value in fields[4:]] or [0, 1]
+        board.setup_state('white' if turn == 'w' else 'black', castling_rights,
+                          ep_square, *counters)
+        return board
+
+    def to_fen(self):
+        """Return the FEN string of the position."""
+        rows = []
+        for row in range(7, -1, -1):
+            row_str = ''
+            n_empty = 0
+            for col in range(8):
+                piece = self.board[row][col].contents
+                if piece is None:
+                    n_empty += 1
+                    continue
+                if n_empty:
+                    row_str += str(n_empty)
+                    n_empty = 0
+                kind = piece.short_name
+                row_str += kind.upper() if piece.color == 'white' else kind.lower()
+            if n_empty:
+                row_str += str(n_empty)
+            rows.append(row_str)
+        castling = ''.join(char for right, char in CASTLING_CHARS
+                           if self.castling_rights & right) or '-'
+        ep_field = '-'
+        if self.ep_square is not None:
+            ep_field = self.field_name(to_position(self.ep_square))
+        return ' '.join(['/'.join(rows), self.turn[0], castling, ep_field,
+                         str(self.halfmove_clock), str(self.fullmove_number)])
+
+    def _put(self, piece, sq):
+        """Put PIECE on an empty square while setting up a position.
+
+        Unlike ``set`` this does not update the hash or castling rights, see
+        ``setup_state``.
+        """
+        position = (sq >> 3, sq & 7)
+        self.board[position[0]][position[1]].set(piece)
+        self.bitboards[piece.color][piece.short_name] |= BIT[sq]
+        self.occupancy[piece.color] |= BIT[sq]
+        if piece.short_name == 'K':
+            self.king_positions[piece.color] = position
+
+    def setup_state(self, turn, castling_rights, ep_square, halfmove_clock=0,
+                    fullmove_number=1):
+        """Set side to move, castling rights, en passant and move counters.
+
+        Kings and rooks without castling rights and pawns off their starting
+        row count as moved. A castling right is dropped unless the king and
+        rook are on their starting fields. Used after placing pieces on an
+        empty board.
+        """
+        for color, start_row in (('white', 1), ('black', 6)):
+            for sq in iter_squares(self.occupancy[color]):
+                piece = self.board[sq >> 3][sq & 7].contents
+                if piece.short_name in ('K', 'R'):
+                    piece.n_moves = 1
+                elif piece.short_name == 'p':
+                    piece.n_moves = 0 if sq >> 3 == start_row else 1
+        for right, color, king_pos, rook_pos in CASTLING:
+            if castling_rights & right:
+                king = self.get(king_pos).get()
+                rook = self.get(rook_pos).get()
+                if (king is None or rook is None or king.short_name != 'K'
+                        or rook.short_name != 'R' or king.color != color
+                        or rook.color != color):
+                    continue
+                king.n_moves = 0
+                rook.n_moves = 0
+        self.turn = turn
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        self.ep_square = None
+        if ep_square is not None and self._mark_en_passant(ep_square, True):
+            self.ep_square = ep_square
+        self.update_castling_rights()
+        self.hash = self.compute_hash()
+
+    def pieces(self, color=None):
+        """Return the pieces on the board, optionally only of COLOR."""
+        colors = ('white', 'black') if color is None else (color,)
+        return [self.board[sq >> 3][sq & 7].contents
+                for color in colors for sq in iter_squares(self.occupancy[color])]
+
     def get(self, position):
         return self.board[position[0]][position[1]]
 
     def set(self, piece, position):
         """Place a piece."""
-        self.board[position[0]][position[1]].set(piece)
-        # did the king move?
+        field = self.board[position[0]][position[1]]
+        sq = to_square(position)
+        bit = BIT[sq]
+        old_piece = field.contents
+        self._attacked['white'] = self._attacked['black'] = None
+        if old_piece is not None:
+            self.bitboards[old_piece.color][old_piece.short_name] &= ~bit
+            self.occupancy[old_piece.color] &= ~bit
+            self.hash ^= PIECE_KEYS[old_piece.color][old_piece.short_name][sq]
         if piece is None:
-            self.get(position).occupied = False
-        elif piece.short_name == 'K':
-            self.king_positions[piece.color] = position
+            field.empty()
+        else:
+            field.set(piece)
+            self.bitboards[piece.color][piece.short_name] |= bit
+            self.occupancy[piece.color] |= bit
+            self.hash ^= PIECE_KEYS[piece.color][piece.short_name][sq]
+            # did the king move?
+            if piece.short_name == 'K':
+                self.king_positions[piece.color] = position
+        if bit & CASTLING_FIELDS:
+            self.update_castling_rights()
+
+    def compute_castling_rights(self):
+        """Determine castling rights from the unmoved kings and rooks."""
+        rights = 0
+        for right, color, king_pos, rook_pos in CASTLING:
+            king = self.board[king_pos[0]][king_pos[1]].contents
+            rook = self.board[rook_pos[0]][rook_pos[1]].contents
+            if (king is not None and king.short_name == 'K' and king.color == color
+                    and king.n_moves == 0 and rook is not None
+                    and rook.short_name == 'R' and rook.color == color
+                    and rook.n_moves == 0):
+                rights |= right
+        return rights
+
+    def update_castling_rights(self):
+        """Update castling rights and hash after kings or rooks changed."""
+        rights = self.compute_castling_rights()
+        self.hash ^= CASTLING_KEYS[self.castling_rights] ^ CASTLING_KEYS[rights]
+        self.castling_rights = rights
+
+    def compute_hash(self):
+        """Compute the Zobrist hash of the position from scratch."""
+        key = CASTLING_KEYS[self.compute_castling_rights()]
+        for color, pieces in self.bitboards.items():
+            for kind, mask in pieces.items():
+                piece_keys = PIECE_KEYS[color][kind]
+                for sq in iter_squares(mask):
+                    key ^= piece_keys[sq]
+        if self.ep_square is not None:
+            key ^= EN_PASSANT_KEYS[self.ep_square & 7]
+        if self.turn == 'white':
+            key ^= TURN_KEY
+        return key
+
+    def empty(self, position):
+        """Remove the piece at a position."""
+        self.set(None, position)
+
+    def attackers(self, sq, color, occupied=None):
+        """Return bitboard of pieces of COLOR attacking square SQ."""
+        if occupied is None:
+            occupied = self.occupancy['white'] | self.occupancy['black']
+        pieces = self.bitboards[color]
+        attackers = (PAWN_ATTACKS[self.opponent_color(color)][sq] & pieces['p']
+                     | KNIGHT_ATTACKS[sq] & pieces['N']
+                     | KING_ATTACKS[sq] & pieces['K'])
+        diagonal = pieces['B'] | pieces['Q']
+        if diagonal:
+            attackers |= bishop_attacks(sq, occupied) & diagonal
+        straight = pieces['R'] | pieces['Q']
+        if straight:
+            attackers |= rook_attacks(sq, occupied) & straight
+        return attackers
+
+    def is_attacked(self, sq, color):
+        """Check if square SQ is attacked by a piece of COLOR."""
+        return self.attackers(sq, color) != 0
+
+    def attack_mask(self, color, occupied=None):
+        """Return bitboard of all squares attacked by COLOR."""
+        pieces = self.bitboards[color]
+        if occupied is None:
+            occupied = self.occupancy['white'] | self.occupancy['black']
+        mask = pawn_attack_mask(pieces['p'], color)
+        for sq in iter_squares(pieces['N']):
+            mask |= KNIGHT_ATTACKS[sq]
+        for sq in iter_squares(pieces['B'] | pieces['Q']):
+            mask |= bishop_attacks(sq, occupied)
+        for sq in iter_squares(pieces['R'] | pieces['Q']):
+            mask |= rook_attacks(sq, occupied)
+        for sq in iter_squares(pieces['K']):
+            mask |= KING_ATTACKS[sq]
+        return mask
+
+    def attacked_squares(self, color):
+        """Return bitboard of all squares attacked by COLOR.
+
+        The map is computed once per position and kept until the pieces
+        change; unmake_move restores the maps of the previous position. The
+        sliders look through the king of the other color, so the map also
+        tells which fields that king may not step to.
+        """
+        attacked = self._attacked[color]
+        if attacked is None:
+            occupied = ((self.occupancy['white'] | self.occupancy['black'])
+                        & ~self.bitboards[self.opponent_color(color)]['K'])
+            attacked = self.attack_mask(color, occupied)
+            self._attacked[color] = attacked
+        return attacked
+
+    def piece_targets(self, piece, sq, captures=True, quiets=True):
+        """Return bitboard of pseudo-legal targets of PIECE standing on SQ.
+
+        Castling is not included, see ``may_castle``.
+        """
+        own = self.occupancy[piece.color]
+        enemy = self.occupancy[self.opponent_color(piece.color)]
+        occupied = own | enemy
+        kind = piece.short_name
+        if kind == 'p':
+            targets = 0
+            if captures:
+                targets = PAWN_ATTACKS[piece.color][sq] & enemy
+                if (self.ep_square is not None
+                        and PAWN_ATTACKS[piece.color][sq] & BIT[self.ep_square]):
+                    targets |= BIT[self.ep_square]
+            if quiets:
+                if piece.color == 'white':
+                    step, start_row, last_row = 8, 1, 7
+                else:
+                    step, start_row, last_row = -8, 6, 0
+                if sq >> 3 != last_row and not occupied & BIT[sq + step]:
+                    targets |= BIT[sq + step]
+                    if sq >> 3 == start_row and not occupied & BIT[sq + 2 * step]:
+                        targets |= BIT[sq + 2 * step]
+            return targets
+        if kind == 'N':
+            targets = KNIGHT_ATTACKS[sq]
+        elif kind == 'B':
+            targets = bishop_attacks(sq, occupied)
+        elif kind == 'R':
+            targets = rook_attacks(sq, occupied)
+        elif kind == 'Q':
+            targets = queen_attacks(sq, occupied)
+        else:
+            targets = KING_ATTACKS[sq]
+        mask = 0
+        if captures:
+            mask |= enemy
+        if quiets:
+            mask |= ~occupied
+        return targets & mask
+
+    def exposes_king(self, color, from_sq, to_sq, captured_sq=None):
+        """Check if moving a piece of COLOR leaves its own king in check.
+
+        CAPTURED_SQ is the square of the captured piece if it differs from
+        TO_SQ, which is the case for en passant.
+        """
+        opponent = self.opponent_color(color)
+        enemies = self.bitboards[opponent]
+        if captured_sq is None:
+            captured_sq = to_sq
+        alive = ~BIT[captured_sq]
+        occupied = ((self.occupancy['white'] | self.occupancy['black'])
+                    & ~BIT[from_sq] & alive) | BIT[to_sq]
+
+        king_sq = to_square(self.king_positions[color])
+        if king_sq == from_sq:
+            king_sq = to_sq
+        if (PAWN_ATTACKS[color][king_sq] & enemies['p']
+                | KNIGHT_ATTACKS[king_sq] & enemies['N']
+                | KING_ATTACKS[king_sq] & enemies['K']) & alive:
+            return True
+        diagonal = (enemies['B'] | enemies['Q']) & alive
+        if diagonal and bishop_attacks(king_sq, occupied) & diagonal:
+            return True
+        straight = (enemies['R'] | enemies['Q']) & alive
+        if straight and rook_attacks(king_sq, occupied) & straight:
+            return True
+        return False
+
+    def _captured_square(self, piece, from_pos, to_pos):
+        """Return square of the piece captured by moving PIECE to TO_POS."""
+        if (piece.short_name == 'p' and to_square(to_pos) == self.ep_square
+                and from_pos[1] != to_pos[1]):
+            return to_square((from_pos[0], to_pos[1]))
+        return None
+
+    def _is_castle_move(self, piece, from_pos, to_pos):
+        """Check if moving PIECE from FROM_POS to TO_POS is a castle move."""
+        return (piece.short_name == 'K' and from_pos[0] == to_pos[0]
+                and abs(to_pos[1] - from_pos[1]) == 2)
 
     def legal_move(self, color, from_pos, to_pos, test_check=False):
         """Check if move is legal."""
-        # first check if piece at target is not the same color
-        from_field = self.get(from_pos)
-        to_field = self.get(to_pos)
-        piece = from_field.get()
-        if to_field.occupied:
-            to_piece = to_field.get()
-            if to_piece.color == color:
-                return False
-            else:
-                valid_moves = piece.valid_capture_moves(from_pos)
-        else:
-            # is this a normal move?
-            valid_moves = piece.valid_moves(from_pos)
-
-        # check if this move corresponds to piece abilities
-        if to_pos not in valid_moves:
-            # check if this is a specialty move?
-            valid_moves = piece.specialty_moves(from_pos)
-            # still not a valid (specialty) move?
-            if to_pos not in valid_moves:
-                return False
-            elif piece.short_name == 'K':
-                # separately handle castling
-                if not self.may_castle(piece.color, from_pos, to_pos):
-                    return False
-                else:
-                    # raise castle flag
-                    self.flag_castle = True
-
-        # check if piece does not need to jump
-        if not piece.may_jump:
-            n_steps = max(abs(to_pos[0] - from_pos[0]), abs(to_pos[1] - from_pos[1]))
-            row_dir = np.sign(to_pos[0] - from_pos[0])
-            col_dir = np.sign(to_pos[1] - from_pos[1])
-            for i in range(1, n_steps):
-                if self.get((from_pos[0] + row_dir * i,
-                            from_pos[1] + col_dir * i)).occupied:
-                    return False
+        piece = self.get(from_pos).get()
+        if piece is None or piece.color != color:
+            return False
 
-        # test if king will be in check
-        if test_check:
-            # attempt the move
-            to_piece = to_field.get()
-            self.set(piece, to_pos)
-            from_field.empty()
-            positions_under_attack = self.under_attack_by(self.opponent_color(color))
-            if self.king_positions[piece.color] in positions_under_attack:
-                # undo move
-                self.set(piece, from_pos)
-                self.set(to_piece, to_pos)
+        if self._is_castle_move(piece, from_pos, to_pos):
+            # separately handle castling
+            if not self.may_castle(color, from_pos, to_pos):
                 return False
-            else:
-                # undo move
-                self.set(piece, from_pos)
-                self.set(to_piece, to_pos)
+            # raise castle flag
+            self.flag_castle = True
+            return True
+
+        from_sq = to_square(from_pos)
+        to_sq = to_square(to_pos)
+        if not self.piece_targets(piece, from_sq) & BIT[to_sq]:
+            return False
+
+        if piece.short_name == 'K':
+            return not (test_check and self.attacked_squares(
+                self.opponent_color(color)) & BIT[to_sq])
 
+        # test if king will be in check
+        captured_sq = self._captured_square(piece, from_pos, to_pos)
+        if test_check and self.exposes_king(color, from_sq, to_sq, captured_sq):
+            return False
         return True
 
     def may_castle(self, color, from_pos, to_pos):
         """Determines if king with COLOR can castle."""
-        # simply check if the squares are not under attack
-        if color == 'white':
-            opponent_color = 'black'
-            rook_row = 0
-        else:
-            opponent_color = 'white'
-            rook_row = 7
+        king = self.get(from_pos).get()
+        if (king is None or king.short_name != 'K' or king.color != color
+                or king.n_moves > 0 or to_pos not in king.castle_fields):
+            return False
 
         # obtain rook closest to to_pos
-        rook_col = np.floor(to_pos[1] / 4).astype('int') * 7
+        rook_row = from_pos[0]
+        rook_col = 0 if to_pos[1] < from_pos[1] else 7
         rook = self.get((rook_row, rook_col)).get()
         # check if rook has not moved
-        if rook is None or rook.n_moves > 0:
+        if (rook is None or rook.short_name != 'R' or rook.color != color
+                or rook.n_moves > 0):
             return False
 
-        positions_under_attack = self.under_attack_by(opponent_color)
-        
-        n_steps = abs(to_pos[1] - from_pos[1])
-        col_dir = np.sign(to_pos[1] - from_pos[1])
-        for i in range(1, n_steps + 1):
-            if (from_pos[0], from_pos[1] + col_dir * i) in positions_under_attack:
+        # all fields between king and rook must be empty
+        occupied = self.occupancy['white'] | self.occupancy['black']
+        col_dir = 1 if rook_col > from_pos[1] else -1
+        for col in range(from_pos[1] + col_dir, rook_col, col_dir):
+            if occupied & BIT[to_square((rook_row, col))]:
+                return False
+
+        # the king may not leave, cross or enter an attacked field
+        attacked = self.attacked_squares(self.opponent_color(color))
+        for col in range(from_pos[1], to_pos[1] + col_dir, col_dir):
+            if attacked & BIT[to_square((rook_row, col))]:
                 return False
         return True
 
     def under_attack_by(self, color, test_check=False):
         """Return list of positions under attack."""
-        positions = []
-
-        for row in range(8):
-            for col in range(8):
-                piece = self.get((row, col)).get()
-                if piece is not None and piece.color == color:
-                    positions.extend(self.legal_capture_moves((row, col), test_check))
-        return positions
+        if not test_check:
+            return positions(self.attack_mask(color) & ~self.occupancy[color])
+        return positions(self._move_targets(color, FULL, quiets=False))
 
     def reachable_positions(self, color, test_check=False):
         """Return list of reachable positions."""
-        positions = []
+        return positions(self._move_targets(color, FULL, test_check=test_check))
 
-        for row in range(8):
-            for col in range(8):
-                piece = self.get((row, col)).get()
-                if piece is not None and piece.color == color:
-                    positions.extend(self.legal_moves((row, col), test_check))
-        return positions
+    def _move_targets(self, color, from_mask, captures=True, quiets=True,
+                      test_check=True):
+        """Return bitboard of targets of moves of COLOR starting in FROM_MASK."""
+        if test_check:
+            moves = self.generate_legal_moves(color, captures, quiets)
+        else:
+            moves = self.generate_moves(color, captures, quiets)
+        targets = 0
+        for move in moves:
+            if BIT[move & 63] & from_mask:
+                targets |= BIT[(move >> 6) & 63]
+        return targets
 
     def legal_capture_moves(self, from_pos, test_check=False):
         """Determine legal capture moves for a certain position."""
-        valid_moves = []
         piece = self.get(from_pos).get()
         if piece is None:
             return []
-        capture_moves = piece.valid_capture_moves(from_pos)
-        for to_pos in capture_moves:
-            if self.legal_move(piece.color, from_pos, to_pos, test_check):
-                valid_moves.append(to_pos)
-        return valid_moves
+        return positions(self._move_targets(piece.color, BIT[to_square(from_pos)],
+                                            quiets=False, test_check=test_check))
 
-    # TODO: This and above functions could be combined
     def legal_moves(self, from_pos, test_check=False):
         """Determine legal moves for a certain position."""
-        valid_moves = []
         piece = self.get(from_pos).get()
         if piece is None:
             return []
-        moves = piece.valid_moves(from_pos)
-        for to_pos in moves:
-            if self.legal_move(piece.color, from_pos, to_pos, test_check):
-                valid_moves.append(to_pos)
-        return valid_moves
+        return positions(self._move_targets(piece.color, BIT[to_square(from_pos)],
+                                            test_check=test_check))
 
     @staticmethod
     def opponent_color(color):
@@ -202,59 +574,465 @@ class ChessBoard:
             opponent_color = 'white'
         return opponent_color
 
+    def in_check(self, color):
+        """Test if the king of COLOR is in check."""
+        return bool(self.attacked_squares(self.opponent_color(color))
+                    & self.bitboards[color]['K'])
+
     def check_or_mate(self, color):
         """Test if current player in checkmate."""
         opponent_color = self.opponent_color(color)
-        positions_under_attack = self.under_attack_by(opponent_color)
+        king_sq = to_square(self.king_positions[color])
 
-        check = False
+        check = bool(self.attacked_squares(opponent_color) & BIT[king_sq])
         checkmate = False
+        if check:
+            # mate if no move resolves the check
+            checkmate = next(self.generate_legal_moves(color), None) is None
+        return check, checkmate
 
-        king_position = self.king_positions[color]
-
-        # is king in check?
-        if king_position in positions_under_attack:
-            check = True
-            # can the king move?
-            legal_king_moves = self.legal_capture_moves(king_position, test_check=True)
-            if len(legal_king_moves) == 0:
-                # find the attacker(s)
-                attackers = self.get_attackers(king_position, opponent_color)
-                if len(attackers) > 1:
-                    checkmate = True
-                else:
-                    # check if we can attack the attacker
-                    attacker_position = attackers[0]
-                    attacking_positions = self.under_attack_by(color, test_check=True)
-                    if attacker_position not in attacking_positions:
-                        attacking_piece = self.get(attacker_position).get()
-                        if attacking_piece.may_jump:
-                            checkmate = True
+    def has_legal_moves(self, color):
+        """Test if COLOR has any legal move."""
+        return next(self.generate_legal_moves(color), None) is not None
+
+    def stalemate(self, color):
+        """Test if COLOR is not in check but has no legal move."""
+        return not self.in_check(color) and not self.has_legal_moves(color)
+
+    def insufficient_material(self):
+        """Test if neither side has the material to checkmate.
+
+        This is the case for bare kings, a single minor piece, or only
+        bishops that all stand on fields of the same color.
+        """
+        white = self.bitboards['white']
+        black = self.bitboards['black']
+        if (white['p'] | white['R'] | white['Q']
+                | black['p'] | black['R'] | black['Q']):
+            return False
+        knights = white['N'] | black['N']
+        bishops = white['B'] | black['B']
+        minors = knights | bishops
+        if not minors & (minors - 1):
+            return True
+        return not knights and not (bishops & DARK_SQUARES and bishops & LIGHT_SQUARES)
+
+    def generate_moves(self, color, captures=True, quiets=True):
+        """Yield pseudo-legal moves of COLOR encoded as ints.
+
+        The moves may leave the own king in check, see
+        ``generate_legal_moves``. With CAPTURES or QUIETS set to False the
+        captures (including en passant) or the non-capturing moves (including
+        castling) are skipped. Promotions are generated for every piece.
+        """
+        return self._generate(color, captures, quiets, legal=False)
+
+    def generate_legal_moves(self, color, captures=True, quiets=True):
+        """Yield legal moves of COLOR encoded as ints.
+
+        Instead of playing and testing every move, the checkers and pinned
+        pieces are determined once. Other pieces may then only move to fields
+        that capture the checker or block the check, pinned pieces only along
+        the pin and the king only to fields that are not attacked. En passant
+        is tested separately.
+        """
+        return self._generate(color, captures, quiets, legal=True)
+
+    def pinned(self, color):
+        """Return bitboard of pieces of COLOR pinned to their king."""
+        pieces = self.bitboards[color]
+        if not pieces['K']:
+            return 0
+        king_sq = lsb(pieces['K'])
+        enemies = self.bitboards[self.opponent_color(color)]
+        enemy = self.occupancy[self.opponent_color(color)]
+        snipers = (rook_attacks(king_sq, enemy) & (enemies['R'] | enemies['Q'])
+                   | bishop_attacks(king_sq, enemy) & (enemies['B'] | enemies['Q']))
+        occupied = self.occupancy[color] | enemy
+        pinned = 0
+        for sniper_sq in iter_squares(snipers):
+            blockers = BETWEEN[king_sq][sniper_sq] & occupied
+            if blockers and not blockers & (blockers - 1):
+                pinned |= blockers & self.occupancy[color]
+        return pinned
+
+    def _generate(self, color, captures, quiets, legal):
+        """Yield pseudo-legal or legal moves of COLOR."""
+        pieces = self.bitboards[color]
+        opponent = self.opponent_color(color)
+        enemy = self.occupancy[opponent]
+        occupied = self.occupancy[color] | enemy
+        empty = ~occupied & FULL
+
+        # fields other pieces may move to and the pieces bound to a pin line
+        target_mask = FULL
+        king_mask = FULL
+        pinned = 0
+        checkers = 0
+        if legal and pieces['K']:
+            king_sq = lsb(pieces['K'])
+            king_mask = ~self.attacked_squares(opponent)
+            checkers = self.attackers(king_sq, opponent, occupied)
+            if checkers & (checkers - 1):
+                # double check, only the king may move
+                target_mask = 0
+            elif checkers:
+                target_mask = checkers | BETWEEN[king_sq][lsb(checkers)]
+            pinned = self.pinned(color)
+        capture_mask = enemy & target_mask
+        quiet_mask = empty & target_mask
+
+        # pawns
+        if color == 'white':
+            step, start_row, promotion_row = 8, 1, 6
+        else:
+            step, start_row, promotion_row = -8, 6, 1
+        pawn_attacks = PAWN_ATTACKS[color]
+        ep_bit = BIT[self.ep_square] if self.ep_square is not None else 0
+        for from_sq in iter_squares(pieces['p'] if target_mask else 0):
+            row = from_sq >> 3
+            pin_mask = LINE[king_sq][from_sq] if BIT[from_sq] & pinned else FULL
+            if captures:
+                pawn_captures = pawn_attacks[from_sq] & capture_mask & pin_mask
+                for to_sq in iter_squares(pawn_captures):
+                    move = from_sq | to_sq << 6 | CAPTURE
+                    if row == promotion_row:
+                        for code in (4, 3, 2, 1):
+                            yield move | code << 12
+                    else:
+                        yield move
+                if pawn_attacks[from_sq] & ep_bit:
+                    move = from_sq | self.ep_square << 6 | CAPTURE | EN_PASSANT
+                    if not legal or not self.leaves_king_in_check(color, move):
+                        yield move
+            if quiets:
+                to_sq = from_sq + step
+                if empty & BIT[to_sq] and pin_mask & BIT[to_sq]:
+                    move = from_sq | to_sq << 6
+                    if quiet_mask & BIT[to_sq]:
+                        if row == promotion_row:
+                            for code in (4, 3, 2, 1):
+                                yield move | code << 12
                         else:
-                            reachable_positions = self.reachable_positions(color, test_check=True)
-                            # see if any fields are under attack
-                            n_steps = max(abs(king_position[0] - attacker_position[0]),
-                                          abs(king_position[1] - attacker_position[1]))
-                            row_dir = np.sign(king_position[0] - attacker_position[0])
-                            col_dir = np.sign(king_position[1] - attacker_position[1])
-                            checkmate = True
-                            for i in range(1, n_steps):
-                                if (attacker_position[0] + row_dir * i,
-                                        attacker_position[1] + col_dir * i) in reachable_positions:
-                                    checkmate = False
-        return check, checkmate
+                            yield move
+                    if (row == start_row and quiet_mask & BIT[to_sq + step]
+                            and pin_mask & BIT[to_sq + step]):
+                        yield from_sq | (to_sq + step) << 6 | DOUBLE_PUSH
+
+        # pieces
+        for kind in ('N', 'B', 'R', 'Q', 'K'):
+            if kind == 'K':
+                piece_capture_mask = enemy & king_mask
+                piece_quiet_mask = empty & king_mask
+            elif not target_mask:
+                continue
+            else:
+                piece_capture_mask = capture_mask
+                piece_quiet_mask = quiet_mask
+            for from_sq in iter_squares(pieces[kind]):
+                if kind == 'N':
+                    if BIT[from_sq] & pinned:
+                        # a pinned knight can never move
+                        continue
+                    targets = KNIGHT_ATTACKS[from_sq]
+                elif kind == 'B':
+                    targets = bishop_attacks(from_sq, occupied)
+                elif kind == 'R':
+                    targets = rook_attacks(from_sq, occupied)
+                elif kind == 'Q':
+                    targets = queen_attacks(from_sq, occupied)
+                else:
+                    targets = KING_ATTACKS[from_sq]
+                if BIT[from_sq] & pinned:
+                    targets &= LINE[king_sq][from_sq]
+                if captures:
+                    for to_sq in iter_squares(targets & piece_capture_mask):
+                        yield from_sq | to_sq << 6 | CAPTURE
+                if quiets:
+                    for to_sq in iter_squares(targets & piece_quiet_mask):
+                        yield from_sq | to_sq << 6
+
+        # castling
+        if quiets and pieces['K'] and not checkers:
+            king_pos = self.king_positions[color]
+            king = self.get(king_pos).get()
+            if king.n_moves == 0:
+                for castle_pos in king.castle_fields:
+                    if self.may_castle(color, king_pos, castle_pos):
+                        yield (to_square(king_pos) | to_square(castle_pos) << 6
+                               | CASTLE)
+
+    def leaves_king_in_check(self, color, move):
+        """Check if an encoded move leaves the king of COLOR in check."""
+        if move & CASTLE:
+            # castling is only generated when the king passes safely
+            return False
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        if self.bitboards[color]['K'] & BIT[from_sq]:
+            return bool(self.attacked_squares(self.opponent_color(color))
+                        & BIT[to_sq])
+        if move & EN_PASSANT:
+            return self.exposes_king(color, from_sq, to_sq,
+                                     (from_sq & ~7) | (to_sq & 7))
+        return self.exposes_king(color, from_sq, to_sq)
+
+    def perft(self, depth):
+        """Count the leaf nodes of the legal move tree of DEPTH plies.
+
+        The side to move is ``turn``.
+        """
+        moves = list(self.generate_legal_moves(self.turn))
+        if depth <= 1:
+            return len(moves) if depth == 1 else 1
+        nodes = 0
+        for move in moves:
+            undo_token = self.make_move(move)
+            nodes += self.perft(depth - 1)
+            self.unmake_move(undo_token)
+        return nodes
+
+    def divide(self, depth):
+        """Return perft node counts of DEPTH plies per root move.
+
+        The moves are given in coordinate notation, e.g. 'e2e4'.
+        """
+        counts = {}
+        for move in list(self.generate_legal_moves(self.turn)):
+            undo_token = self.make_move(move)
+            counts[move_name(move)] = self.perft(depth - 1)
+            self.unmake_move(undo_token)
+        return counts
+
+    def see(self, move):
+        """Return the static exchange evaluation of an encoded move.
+
+        This is the material balance, in centipawns for the side making the
+        move, after both sides alternately recapture on the target field
+        with their least valuable piece for as long as that pays off.
+        """
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        color = self.turn
+        fields = self.board
+        piece = fields[from_sq >> 3][from_sq & 7].contents
+        occupied = (self.occupancy['white'] | self.occupancy['black']) & ~BIT[from_sq]
+        if move & EN_PASSANT:
+            gain = SEE_VALUES['p']
+            occupied &= ~BIT[(from_sq & ~7) | (to_sq & 7)]
+        else:
+            captured = fields[to_sq >> 3][to_sq & 7].contents
+            gain = SEE_VALUES[captured.short_name] if captured is not None else 0
+        promotion = PROMOTION_PIECES[(move >> 12) & 7]
+        if promotion is not None:
+            gain += SEE_VALUES[promotion] - SEE_VALUES['p']
+            on_field = SEE_VALUES[promotion]
+        else:
+            on_field = SEE_VALUES[piece.short_name]
+
+        white = self.bitboards['white']
+        black = self.bitboards['black']
+        diagonal = white['B'] | white['Q'] | black['B'] | black['Q']
+        straight = white['R'] | white['Q'] | black['R'] | black['Q']
+        attackers = (self.attackers(to_sq, 'white', occupied)
+                     | self.attackers(to_sq, 'black', occupied)) & occupied
+        gains = [gain]
+        side = self.opponent_color(color)
+        while True:
+            own = attackers & self.occupancy[side]
+            if not own:
+                break
+            for kind in SEE_ORDER:
+                candidates = own & self.bitboards[side][kind]
+                if candidates:
+                    break
+            gains.append(on_field - gains[-1])
+            occupied &= ~(candidates & -candidates)
+            # pieces behind the capturing piece join in
+            attackers |= (bishop_attacks(to_sq, occupied) & diagonal
+                          | rook_attacks(to_sq, occupied) & straight)
+            attackers &= occupied
+            on_field = SEE_VALUES[kind]
+            side = self.opponent_color(side)
+        # every side may also stop capturing
+        while len(gains) > 1:
+            last = gains.pop()
+            gains[-1] = -max(-gains[-1], last)
+        return gains[0]
 
     def get_attackers(self, position, opponent_color):
         """Find the attacking piece of a certain position."""
-        # TODO: make simpler
-        attackers = []
-        for row in range(8):
-            for col in range(8):
-                piece = self.get((row, col)).get()
-                if piece is not None and piece.color == opponent_color:
-                    if position in self.legal_capture_moves((row, col)):
-                        attackers.append((row, col))
-        return attackers
+        return positions(self.attackers(to_square(position), opponent_color))
+
+    def encode_move(self, from_pos, to_pos, promotion=None):
+        """Encode a move of the piece at FROM_POS into an int.
+
+        PROMOTION is the short name of the piece a pawn promotes to. Without
+        it a pawn reaching the last row leaves the promotion pending, see
+        ``promotion``.
+        """
+        piece = self.get(from_pos).get()
+        from_sq = to_square(from_pos)
+        to_sq = to_square(to_pos)
+        flags = 0
+        if self.get(to_pos).occupied:
+            flags |= CAPTURE
+        if piece.short_name == 'p':
+            if abs(to_pos[0] - from_pos[0]) == 2:
+                flags |= DOUBLE_PUSH
+            elif to_sq == self.ep_square and from_pos[1] != to_pos[1]:
+                flags |= CAPTURE | EN_PASSANT
+        elif self._is_castle_move(piece, from_pos, to_pos):
+            flags |= CASTLE
+        promotion_code = PROMOTION_CODES[promotion] if promotion else 0
+        return encode(from_sq, to_sq, promotion_code, flags)
+
+    def make_move(self, move):
+        """Play an encoded move without testing its legality.
+
+        Returns an undo token that restores the position when passed to
+        ``unmake_move``. Moves must be undone in reverse order.
+        """
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        from_pos = (from_sq >> 3, from_sq & 7)
+        to_pos = (to_sq >> 3, to_sq & 7)
+        piece = self.board[from_pos[0]][from_pos[1]].contents
+        if move & EN_PASSANT:
+            captured_pos = (from_pos[0], to_pos[1])
+        else:
+            captured_pos = to_pos
+        captured = self.board[captured_pos[0]][captured_pos[1]].contents
+
+        undo_token = (move, piece, captured, self.ep_square, self.promotion,
+                      self.flag_castle, self.turn, self.hash, self.castling_rights,
+                      self._attacked['white'], self._attacked['black'],
+                      self.halfmove_clock)
+
+        # reset en passant
+        if self.ep_square is not None:
+            self._mark_en_passant(self.ep_square, False)
+            self.hash ^= EN_PASSANT_KEYS[self.ep_square & 7]
+            self.ep_square = None
+
+        if captured is not None and captured_pos != to_pos:
+            self.set(None, captured_pos)
+        self.set(None, from_pos)
+        promotion = (move >> 12) & 7
+        if promotion:
+            self.set(PROMOTION_CLASSES[promotion](piece.color, to_pos), to_pos)
+        else:
+            self.set(piece, to_pos)
+        piece.n_moves += 1
+
+        if move & CASTLE:
+            # also move corresponding rook
+            rook_from, rook_to = self._castle_rook_positions(to_pos)
+            rook = self.get(rook_from).get()
+            self.set(None, rook_from)
+            self.set(rook, rook_to)
+            rook.n_moves += 1
+
+        # check for promotion
+        self.promotion = None
+        if piece.short_name == 'p' and not promotion and to_pos[0] in (0, 7):
+            self.promotion = (piece, to_pos)
+
+        # check for en passant
+        if move & DOUBLE_PUSH:
+            ep_square = (from_sq + to_sq) >> 1
+            if self._mark_en_passant(ep_square, True):
+                self.ep_square = ep_square
+                self.hash ^= EN_PASSANT_KEYS[ep_square & 7]
+
+        if piece.short_name == 'p' or captured is not None:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if piece.color == 'black':
+            self.fullmove_number += 1
+
+        self.flag_castle = False
+        turn = self.opponent_color(piece.color)
+        if turn != self.turn:
+            self.turn = turn
+            self.hash ^= TURN_KEY
+        self.undo_stack.append(undo_token)
+        return undo_token
+
+    def unmake_move(self, undo_token):
+        """Take back the move that returned UNDO_TOKEN."""
+        (move, piece, captured, ep_square, promotion, flag_castle, turn,
+         hash_key, castling_rights, white_attacked, black_attacked,
+         halfmove_clock) = undo_token
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        from_pos = (from_sq >> 3, from_sq & 7)
+        to_pos = (to_sq >> 3, to_sq & 7)
+
+        if self.ep_square is not None:
+            self._mark_en_passant(self.ep_square, False)
+
+        if move & CASTLE:
+            rook_from, rook_to = self._castle_rook_positions(to_pos)
+            rook = self.get(rook_to).get()
+            self.set(None, rook_to)
+            self.set(rook, rook_from)
+            rook.n_moves -= 1
+
+        self.set(piece, from_pos)
+        piece.n_moves -= 1
+        if move & EN_PASSANT:
+            self.set(None, to_pos)
+            self.set(captured, (from_pos[0], to_pos[1]))
+        else:
+            self.set(captured, to_pos)
+
+        self.ep_square = ep_square
+        if ep_square is not None:
+            self._mark_en_passant(ep_square, True)
+        self.promotion = promotion
+        self.flag_castle = flag_castle
+        self.turn = turn
+        self.hash = hash_key
+        self.castling_rights = castling_rights
+        self._attacked['white'] = white_attacked
+        self._attacked['black'] = black_attacked
+        self.halfmove_clock = halfmove_clock
+        if piece.color == 'black':
+            self.fullmove_number -= 1
+        self.undo_stack.pop()
+
+    @staticmethod
+    def _castle_rook_positions(king_to_pos):
+        """Return from and to positions of the rook when castling."""
+        row, col = king_to_pos
+        if col < 4:
+            return (row, 0), (row, 3)
+        return (row, 7), (row, 5)
+
+    def _mark_en_passant(self, ep_square, enable):
+        """Set or reset en passant on the pawns next to a double pushed pawn.
+
+        EP_SQUARE is the field the pawn passed. Returns whether any pawn may
+        capture en passant.
+        """
+        ep_row, col = ep_square >> 3, ep_square & 7
+        pawn_row = 3 if ep_row == 2 else 4
+        pushed_color = 'white' if ep_row == 2 else 'black'
+        found = False
+        for neighbor_col in (col - 1, col + 1):
+            if not 0 <= neighbor_col < 8:
+                continue
+            neighbor = self.board[pawn_row][neighbor_col].contents
+            if (neighbor is not None and neighbor.short_name == 'p'
+                    and neighbor.color != pushed_color):
+                if enable:
+                    neighbor.set_en_passant((ep_row, col), (pawn_row, col))
+                else:
+                    neighbor.reset_en_passant()
+                found = True
+        return found
 
     def move(self, color, from_pos, to_pos):
         """Move a piece.
@@ -262,81 +1040,10 @@ class ChessBoard:
         Returns notation of the move (if legal) and the captured piece.
         If no piece was captured then the returned piece is None.
         """
-        opponent_color = self.opponent_color(color)
         if self.legal_move(color, from_pos, to_pos, test_check=True):
             notation = self.get_notation(from_pos, to_pos)
-            # check if castle move
-            if self.flag_castle:
-                # also move corresponding rook
-                rook_col = np.floor(to_pos[1] / 4).astype('int') * 7
-                rook_field = self.get((from_pos[0], rook_col))
-                rook = rook_field.get()
-
-                # determine queen side or king side
-                if rook_col == 0:
-                    notation = 'O-O-O'
-                else:
-                    notation = 'O-O'
-
-                rook_field.empty()
-                rook_col = to_pos[1] + np.sign(from_pos[1] - to_pos[1])
-                rook_field = self.get((from_pos[0], rook_col))
-                rook_field.set(rook)
-                # recall castle flag
-                self.flag_castle = False
-
-            # reset promotion
-            self.promotion = None
-            step = to_pos[0] - from_pos[0]
-
-            # get field
-            from_field = self.get(from_pos)
-            to_field = self.get(to_pos)
-            # get piece
-            piece = from_field.get()
-            captured_piece = to_field.get()
-
-            # check for promotion
-            if piece.short_name == 'p':
-                if (piece.color == 'black' and to_pos[0] == 0 or
-                        piece.color == 'white' and to_pos[0] == 7):
-                    self.promotion = (piece, to_pos)
-
-            # handle and then reset en passant
-            if self.en_passant_pieces is not []:
-                # was a piece captured en passant?
-                if piece.short_name == 'p' and piece.en_passant == to_pos:
-                    # remove piece from board
-                    attacked_field = self.get(piece.attacked_position)
-                    captured_piece = attacked_field.get()
-                    attacked_field.empty()
-                for en_passant_piece in self.en_passant_pieces:
-                    en_passant_piece.reset_en_passant()
-                self.en_passant_pieces = []
-
-            # check for en passant
-            if piece.short_name == 'p' and abs(step) == 2:
-                # Are the neighboring fields enemy pawns?
-                neighbors = [self.get((to_pos[0], to_pos[1] - i)).get()
-                             for i in [-1, 1]
-                             if on_board((to_pos[0], to_pos[1] - i))]
-                direction = np.sign(step)
-
-                for neighbor in neighbors:
-                    if (neighbor is not None and neighbor.short_name == 'p'
-                            and neighbor.color == opponent_color):
-                        # add position to capture moves
-                        neighbor.set_en_passant((to_pos[0] - direction, to_pos[1]), to_pos)
-                        self.en_passant_pieces.append(neighbor)
-
-            # empty field
-            from_field.empty()
-            # put piece to field
-            self.set(piece, to_pos)
-            # increment number of moves
-            piece.n_moves += 1
-
-            return notation, captured_piece
+            undo_token = self.make_move(self.encode_move(from_pos, to_pos))
+            return notation, undo_token[2]
         else:
             # make sure castle flag is recalled
             self.flag_castle = False
@@ -351,7 +1058,12 @@ class ChessBoard:
         """Get notation of move."""
         from_piece = self.get(from_pos).get()
         to_piece = self.get(to_pos).get()
-        
+
+        if self._is_castle_move(from_piece, from_pos, to_pos):
+            return 'O-O-O' if to_pos[1] < from_pos[1] else 'O-O'
+        if self._captured_square(from_piece, from_pos, to_pos) is not None:
+            to_piece = self.get((from_pos[0], to_pos[1])).get()
+
         if from_piece.short_name == 'p':
             notation_str = ''
         else:
@@ -364,6 +1076,135 @@ class ChessBoard:
         notation_str += self.field_name(to_pos)
         return notation_str
 
+    def san(self, move):
+        """Return the standard algebraic notation of a legal encoded move.
+
+        Moves are disambiguated by file, rank or both and get suffixes for
+        promotion (``=Q``), check (``+``) and checkmate (``#``).
+        """
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        color = self.turn
+        kind = self._kind_at(color, from_sq)
+        if move & CASTLE:
+            notation = 'O-O-O' if to_sq & 7 < from_sq & 7 else 'O-O'
+        elif kind == 'p':
+            notation = ''
+            if move & CAPTURE:
+                notation = self.col_names[from_sq & 7] + 'x'
+            notation += self.field_name(to_position(to_sq))
+            promotion = PROMOTION_PIECES[(move >> 12) & 7]
+            if promotion is not None:
+                notation += '=' + promotion
+        else:
+            # other pieces of the same kind that can reach the field
+            others = 0
+            for other in self.generate_legal_moves(color, quiets=not move & CAPTURE,
+                                                   captures=bool(move & CAPTURE)):
+                other_from = other & 63
+                if ((other >> 6) & 63 == to_sq and other_from != from_sq
+                        and self.bitboards[color][kind] & BIT[other_from]):
+                    others |= BIT[other_from]
+            notation = kind
+            if others:
+                if not others & (FILE_A << (from_sq & 7)):
+                    notation += self.col_names[from_sq & 7]
+                elif not others & (RANK_1 << (from_sq & ~7)):
+                    notation += str((from_sq >> 3) + 1)
+                else:
+                    notation += self.field_name(to_position(from_sq))
+            if move & CAPTURE:
+                notation += 'x'
+            notation += self.field_name(to_position(to_sq))
+
+        undo_token = self.make_move(move)
+        opponent = self.turn
+        if self.in_check(opponent):
+            mate = next(self.generate_legal_moves(opponent), None) is None
+            notation += '#' if mate else '+'
+        self.unmake_move(undo_token)
+        return notation
+
+    def parse_san(self, san):
+        """Return the encoded legal move of the side to move given in SAN.
+
+        Instead of generating all moves, the pieces that may make the move
+        are looked up from the target field. Raises ValueError if SAN is not
+        a legal move or is ambiguous.
+        """
+        color = self.turn
+        match = SAN_PATTERN.match(san)
+        if match is None:
+            raise ValueError(f"Invalid SAN move `{san}`.")
+        castle, kind, from_col, from_row, to_field, promotion = match.groups()
+        if castle:
+            long_castle = castle.count('-') == 2
+            for move in self.generate_legal_moves(color, captures=False):
+                if move & CASTLE and long_castle == ((move >> 6) & 7 < move & 7):
+                    return move
+            raise ValueError(f"The move `{san}` is illegal.")
+
+        to_sq = to_square((int(to_field[1]) - 1, self.col_names.index(to_field[0])))
+        if self.occupancy[color] & BIT[to_sq]:
+            raise ValueError(f"The move `{san}` is illegal.")
+        pieces = self.bitboards[color][kind or 'p']
+        occupied = self.occupancy['white'] | self.occupancy['black']
+        if kind is None:
+            step = 8 if color == 'white' else -8
+            last_row = 7 if color == 'white' else 0
+            if (to_sq >> 3 == last_row) != (promotion is not None):
+                raise ValueError(f"The move `{san}` is illegal.")
+            if to_sq >> 3 == 7 - last_row:
+                # pawns never reach their own back row
+                raise ValueError(f"The move `{san}` is illegal.")
+            if from_col and from_col != to_field[0]:
+                # capture
+                if not ((self.occupancy[self.opponent_color(color)] & BIT[to_sq])
+                        or to_sq == self.ep_square):
+                    raise ValueError(f"The move `{san}` is illegal.")
+                sources = PAWN_ATTACKS[self.opponent_color(color)][to_sq] & pieces
+            elif occupied & BIT[to_sq]:
+                sources = 0
+            elif pieces & BIT[to_sq - step]:
+                sources = BIT[to_sq - step]
+            elif (to_sq >> 3 == (3 if color == 'white' else 4)
+                    and pieces & BIT[to_sq - 2 * step]
+                    and not occupied & BIT[to_sq - step]):
+                sources = BIT[to_sq - 2 * step]
+            else:
+                sources = 0
+        elif kind == 'N':
+            sources = KNIGHT_ATTACKS[to_sq] & pieces
+        elif kind == 'B':
+            sources = bishop_attacks(to_sq, occupied) & pieces
+        elif kind == 'R':
+            sources = rook_attacks(to_sq, occupied) & pieces
+        elif kind == 'Q':
+            sources = queen_attacks(to_sq, occupied) & pieces
+        else:
+            sources = KING_ATTACKS[to_sq] & pieces
+        if from_col:
+            sources &= FILE_A << self.col_names.index(from_col)
+        if from_row:
+            sources &= RANK_1 << 8 * (int(from_row) - 1)
+
+        candidates = []
+        for from_sq in iter_squares(sources):
+            move = self.encode_move(to_position(from_sq), to_position(to_sq), promotion)
+            if not self.leaves_king_in_check(color, move):
+                candidates.append(move)
+        if len(candidates) != 1:
+            reason = 'ambiguous' if candidates else 'illegal'
+            raise ValueError(f"The move `{san}` is {reason}.")
+        return candidates[0]
+
+    def _kind_at(self, color, sq):
+        """Return the short name of the piece of COLOR on SQ, or None."""
+        for kind, mask in self.bitboards[color].items():
+            if mask & BIT[sq]:
+                return kind
+        return None
+
     def show(self):
         """Show self."""
         # start from last row
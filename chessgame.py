@@ -1,30 +1,120 @@
 """A game of chess."""
-from enum import Enum, auto
+import sys
+from enum import Enum, IntEnum, auto
 from chessplayer import ChessPlayer
 from chessboard import ChessBoard
+from chessmove import PROMOTION_CODES, move_from, move_promotion, move_to
+from bitboard import to_position
 import chesspiece
 
 
-class GameState(Enum):
-    """Chess game states."""
-    CHECKMATE = auto()
-    CHECK = auto()
+class GameState(IntEnum):
+    """Chess game states, as returned by ChessGame.move."""
+    ILLEGAL = 0
+    NORMAL = 1
+    CHECK = 2
+    CHECKMATE = 3
+    PROMOTION = 4
+    STALEMATE = 5
+    REPETITION = 6
+    FIFTY_MOVES = 7
+    INSUFFICIENT_MATERIAL = 8
+
+
+# states that end the game
+GAME_OVER = (GameState.CHECKMATE, GameState.STALEMATE, GameState.REPETITION,
+             GameState.FIFTY_MOVES, GameState.INSUFFICIENT_MATERIAL)
+
+
+class GameEvent(Enum):
+    """Events a ChessGame reports to its observers, see ChessGame.subscribe.
+
+    Observers are called as ``observer(game, event, **details)`` with the
+    details:
+
+    * MOVE: color, move_number, notation and the encoded move
+    * CAPTURE: color of the capturing player and the captured piece
+    * PROMOTION: piece and position of a pawn waiting for its promotion
+    * CHECK, CHECKMATE: color of the player in check
+    * GAME_OVER: state and result of the game
+    """
+    MOVE = auto()
+    CAPTURE = auto()
     PROMOTION = auto()
-    NORMAL = auto()
+    CHECK = auto()
+    CHECKMATE = auto()
+    GAME_OVER = auto()
+
+
+PROMOTION_NAMES = {'Q': 'Queen', 'R': 'Rook', 'B': 'Bishop', 'N': 'Knight'}
 
 
 class ChessGame:
     """A game of chess."""
 
-    def __init__(self):
-        """Instantiate object."""
-        self.chessboard = ChessBoard()
-        self.player_white = ChessPlayer('white')
-        self.player_black = ChessPlayer('black')
-        self.setup_board()
-        self.current_player = self.player_white
+    def __init__(self, engine_white=None, engine_black=None, chessboard=None,
+                 book=None):
+        """Instantiate object.
+
+        Players with an engine can play their moves with play_engine_move,
+        they take their moves from the opening BOOK while they can.
+        Without CHESSBOARD the game starts from the initial position,
+        otherwise the players take the pieces on the given board.
+        """
+        if chessboard is None:
+            self.chessboard = ChessBoard()
+            self.player_white = ChessPlayer('white', engine_white, book=book)
+            self.player_black = ChessPlayer('black', engine_black, book=book)
+            self.setup_board()
+        else:
+            self.chessboard = chessboard
+            self.player_white = ChessPlayer('white', engine_white,
+                                            chessboard.pieces('white'), book)
+            self.player_black = ChessPlayer('black', engine_black,
+                                            chessboard.pieces('black'), book)
+        if self.chessboard.turn == 'white':
+            self.current_player = self.player_white
+        else:
+            self.current_player = self.player_black
         self.moves = 0
-        self.move_number = 1
+        self.move_number = self.chessboard.fullmove_number
+        # starting position and encoded moves played since, see pgn.PGNGame
+        self.start_fen = self.chessboard.to_fen()
+        self.history = []
+        # hashes of the positions since the last capture or pawn move and
+        # how often each of them occurred
+        self.hash_history = []
+        self.position_counts = {}
+        self.state = GameState.NORMAL
+        # observers per event, only events with observers have an entry
+        self.observers = {}
+        # (hash, pending promotion, targets) of the last position asked for,
+        # see legal_targets
+        self._legal_targets = None
+        self._record_position()
+        self._update_state()
+
+    @classmethod
+    def from_fen(cls, fen, engine_white=None, engine_black=None, book=None):
+        """Start a game from the position of a FEN string."""
+        return cls(engine_white, engine_black, ChessBoard.from_fen(fen), book)
+
+    def subscribe(self, event, observer):
+        """Call OBSERVER on every EVENT, see GameEvent."""
+        self.observers.setdefault(event, []).append(observer)
+
+    def unsubscribe(self, event, observer):
+        """Stop calling OBSERVER on EVENT."""
+        observers = self.observers.get(event, [])
+        if observer in observers:
+            observers.remove(observer)
+        if not observers:
+            self.observers.pop(event, None)
+
+    def notify(self, event, **details):
+        """Call the observers of EVENT."""
+        for observer in self.observers.get(event, ()):
+            observer(self, event, **details)
 
     def setup_board(self):
         """Initialize the board."""
@@ -32,6 +122,10 @@ class ChessGame:
             for piece in player.active_pieces:
                 self.chessboard.set(piece, piece.initial_position)
 
+    def to_fen(self):
+        """Return the FEN string of the current position."""
+        return self.chessboard.to_fen()
+
     def print_board(self):
         """Print the board contents."""
         self.chessboard.show()
@@ -40,12 +134,41 @@ class ChessGame:
         """Get the board."""
         return self.chessboard
 
+    def perft(self, depth):
+        """Count the leaf nodes of the legal move tree of DEPTH plies."""
+        return self.chessboard.perft(depth)
+
+    def divide(self, depth):
+        """Return perft node counts of DEPTH plies per root move."""
+        return self.chessboard.divide(depth)
+
+    def legal_targets(self):
+        """Return the legal target positions per position of the player to move.
+
+        The moves are generated once per position, later calls for the same
+        position are a lookup.
+        """
+        board = self.chessboard
+        key = (board.hash, board.promotion)
+        if self._legal_targets is None or self._legal_targets[:2] != key:
+            targets = {}
+            # no moves until a pending promotion is finished
+            if not board.promotion:
+                for move in board.generate_legal_moves(self.current_player.color):
+                    targets.setdefault(to_position(move_from(move)), set()).add(
+                        to_position(move_to(move)))
+            self._legal_targets = key + (targets,)
+        return self._legal_targets[2]
+
     def choose_promotion(self, piece_name, final=False):
-        # promotion state
+        """Replace a promoted pawn by the piece PIECE_NAME.
+
+        Until FINAL the choice may still be changed.
+        """
         if not self.chessboard.promotion:
             return False
 
-        state = 4
+        state = GameState.PROMOTION
         promoted_piece, promoted_pos = self.chessboard.promotion
         if piece_name == 'Queen':
             new_piece = chesspiece.Queen(promoted_piece.color, promoted_pos)
@@ -62,15 +185,10 @@ class ChessGame:
 
         if final:
             self.chessboard.promotion = None
-            # check for check or checkmate!
-            check, checkmate = self.chessboard.check_or_mate(self.current_player.color)
-            # return state
-            if checkmate:
-                state = 3
-            elif check:
-                state = 2
-            else:
-                state = 1
+            self._record_position()
+            state = self._update_state()
+            if self.observers:
+                self._notify_state(state)
             # remove piece from player pieces
             if self.current_player.color == 'black':
                 promoted_player = self.player_white
@@ -78,24 +196,70 @@ class ChessGame:
                 promoted_player = self.player_black
             promoted_player.inactivate_piece(promoted_piece)
             promoted_player.add(new_piece)
+            if self.history:
+                self.history[-1] |= PROMOTION_CODES[new_piece.short_name] << 12
+        return state
+
+    def play(self, move):
+        """Play an encoded move, including the choice of promotion piece."""
+        state = self.move(to_position(move_from(move)), to_position(move_to(move)))
+        promotion = move_promotion(move)
+        if state and promotion is not None and self.chessboard.promotion:
+            state = self.choose_promotion(PROMOTION_NAMES[promotion], final=True)
         return state
 
+    def play_engine_move(self):
+        """Let the current player's engine choose and play a move."""
+        result = self.current_player.choose_move(self.chessboard)
+        if result.best_move is None:
+            return GameState.ILLEGAL
+        return self.play(result.best_move)
+
+    def game_over(self):
+        """Test if the game has ended."""
+        return self.state in GAME_OVER
+
+    def result(self):
+        """Return the result as '1-0', '0-1', '1/2-1/2' or '*' if not over."""
+        if self.state == GameState.CHECKMATE:
+            return '0-1' if self.current_player.color == 'white' else '1-0'
+        if self.state in GAME_OVER:
+            return '1/2-1/2'
+        return '*'
+
     def move(self, from_pos, to_pos):
-        notation, captured_piece = self.chessboard.move(self.current_player.color, from_pos, to_pos)
+        """Move the piece of the current player at FROM_POS to TO_POS.
 
-        # an illegal move was performed
-        if notation is None:
-            return 0
+        Returns the GameState after the move, ILLEGAL if the move is not
+        allowed. Observers are notified of the move, see GameEvent.
+        """
+        board = self.chessboard
+        color = self.current_player.color
+        if not board.legal_move(color, from_pos, to_pos, test_check=True):
+            # make sure castle flag is recalled
+            board.flag_castle = False
+            return GameState.ILLEGAL
+
+        # the notation is only needed by observers
+        notation = None
+        if GameEvent.MOVE in self.observers:
+            notation = board.get_notation(from_pos, to_pos)
+        undo_token = board.make_move(board.encode_move(from_pos, to_pos))
+        move, captured_piece = undo_token[0], undo_token[2]
+        self.history.append(move)
+        if self.observers:
+            self.notify(GameEvent.MOVE, color=color, move_number=self.move_number,
+                        notation=notation, move=move)
 
         # add captured piece to captured_pieces list
         if captured_piece is not None:
             self.current_player.captured_pieces.append(captured_piece)
+            if self.observers:
+                self.notify(GameEvent.CAPTURE, color=color, piece=captured_piece)
         # switch current player
-        if self.current_player.color == 'white':
-            print(str(self.move_number) + '. ' + notation, end=' ')
+        if color == 'white':
             self.current_player = self.player_black
         else:
-            print(notation)
             self.move_number += 1
             self.current_player = self.player_white
 
@@ -103,23 +267,106 @@ class ChessGame:
         if captured_piece is not None:
             self.current_player.inactivate_piece(captured_piece)
 
-        # check for check or checkmate!
-        check, checkmate = self.chessboard.check_or_mate(self.current_player.color)
-        if checkmate:
-            print("Checkmate!")
-        elif check:
-            print("Check!")
+        self.moves += 1
+        # a pending promotion is finished by choose_promotion
+        if board.promotion:
+            self.state = GameState.PROMOTION
+            if self.observers:
+                piece, position = board.promotion
+                self.notify(GameEvent.PROMOTION, piece=piece, position=position)
+            return self.state
+
+        self._record_position()
+        state = self._update_state()
+        if self.observers:
+            self._notify_state(state)
+        return state
+
+    def _notify_state(self, state):
+        """Tell the observers about check and the end of the game."""
+        color = self.current_player.color
+        if state == GameState.CHECK:
+            self.notify(GameEvent.CHECK, color=color)
+        elif state == GameState.CHECKMATE:
+            self.notify(GameEvent.CHECKMATE, color=color)
+        if state in GAME_OVER:
+            self.notify(GameEvent.GAME_OVER, state=state, result=self.result())
 
-        # return state
-        if checkmate:
-            state = 3
+    def _record_position(self):
+        """Add the current position to the position history."""
+        board = self.chessboard
+        if board.halfmove_clock == 0:
+            # earlier positions can not occur again
+            self.hash_history.clear()
+            self.position_counts.clear()
+        self.hash_history.append(board.hash)
+        self.position_counts[board.hash] = self.position_counts.get(board.hash, 0) + 1
+
+    def _update_state(self):
+        """Determine the state of the game for the player to move."""
+        board = self.chessboard
+        color = self.current_player.color
+        check = board.in_check(color)
+        if not board.has_legal_moves(color):
+            state = GameState.CHECKMATE if check else GameState.STALEMATE
+        elif board.insufficient_material():
+            state = GameState.INSUFFICIENT_MATERIAL
+        elif self.position_counts[board.hash] >= 3:
+            state = GameState.REPETITION
+        elif board.halfmove_clock >= 100:
+            state = GameState.FIFTY_MOVES
         elif check:
-            state = 2
-        # check for promoted piece
-        elif self.chessboard.promotion:
-            state = 4
+            state = GameState.CHECK
         else:
-            state = 1
-
-        self.moves += 1
+            state = GameState.NORMAL
+        self.state = state
         return state
+
+
+class GameLogger:
+    """Observer that writes the moves and the course of a game to a stream.
+
+    The moves are written in numbered pairs, e.g. ``1. e4 e5``.
+    """
+
+    events = (GameEvent.MOVE, GameEvent.CHECK, GameEvent.CHECKMATE, GameEvent.GAME_OVER)
+
+    def __init__(self, stream=None):
+        """Create logger writing to STREAM (default: stdout)."""
+        self.stream = stream
+        # a white move was written without ending the line
+        self.line_open = False
+
+    def attach(self, game):
+        """Subscribe to the events of GAME."""
+        for event in self.events:
+            game.subscribe(event, self)
+
+    def detach(self, game):
+        """Unsubscribe from the events of GAME."""
+        for event in self.events:
+            game.unsubscribe(event, self)
+
+    def __call__(self, game, event, **details):
+        """Write an event."""
+        stream = self.stream or sys.stdout
+        self.line_open = event == GameEvent.MOVE and details['color'] == 'white'
+        if event == GameEvent.MOVE:
+            if details['color'] == 'white':
+                stream.write(f"{details['move_number']}. {details['notation']} ")
+            else:
+                stream.write(details['notation'] + '\n')
+        elif event == GameEvent.CHECK:
+            stream.write("Check!\n")
+        elif event == GameEvent.CHECKMATE:
+            stream.write("Checkmate!\n")
+        elif details['state'] != GameState.CHECKMATE:
+            stream.write(f"Draw by {details['state'].name.lower().replace('_', ' ')}!\n")
+
+    def message(self, text):
+        """Write a line of TEXT about the game, e.g. why it was stopped."""
+        stream = self.stream or sys.stdout
+        if self.line_open:
+            stream.write('\n')
+            self.line_open = False
+        stream.write(text + '\n')
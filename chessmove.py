@@ -0,0 +1,56 @@
+"""Compact integer encoding of chess moves.
+
+A move is packed into a single int:
+
+* bits 0-5: square the piece moves from
+* bits 6-11: square the piece moves to
+* bits 12-14: promotion piece, an index into ``PROMOTION_PIECES``
+* bits 15-18: move flags (``CAPTURE``, ``DOUBLE_PUSH``, ``EN_PASSANT``,
+  ``CASTLE``)
+
+Squares are numbered as in the ``bitboard`` module.
+"""
+
+PROMOTION_PIECES = (None, 'N', 'B', 'R', 'Q')
+PROMOTION_CODES = {'N': 1, 'B': 2, 'R': 3, 'Q': 4}
+# bits of the promotion piece
+PROMOTION_MASK = 7 << 12
+
+CAPTURE = 1 << 15
+DOUBLE_PUSH = 1 << 16
+EN_PASSANT = 1 << 17
+CASTLE = 1 << 18
+
+COL_NAMES = 'abcdefgh'
+
+
+def encode(from_sq, to_sq, promotion=0, flags=0):
+    """Pack a move into an int."""
+    return from_sq | to_sq << 6 | promotion << 12 | flags
+
+
+def move_from(move):
+    """Return the square a move starts from."""
+    return move & 63
+
+
+def move_to(move):
+    """Return the square a move goes to."""
+    return (move >> 6) & 63
+
+
+def move_promotion(move):
+    """Return short name of the promotion piece, or None."""
+    return PROMOTION_PIECES[(move >> 12) & 7]
+
+
+def move_name(move):
+    """Return coordinate notation of a move, e.g. 'e2e4' or 'e7e8q'."""
+    from_sq = move & 63
+    to_sq = (move >> 6) & 63
+    name = (COL_NAMES[from_sq & 7] + str((from_sq >> 3) + 1)
+            + COL_NAMES[to_sq & 7] + str((to_sq >> 3) + 1))
+    promotion = PROMOTION_PIECES[(move >> 12) & 7]
+    if promotion is not None:
+        name += promotion.lower()
+    return name
@@ -2,11 +2,41 @@
 
 from abc import ABC
 
-from util import on_board
+from bitboard import (BISHOP_RAYS, KING_ATTACKS, KNIGHT_ATTACKS, PAWN_ATTACKS,
+                      PAWN_PUSHES, QUEEN_RAYS, ROOK_RAYS, positions, to_square)
+
+
+def _position_table(masks):
+    """Turn bitboards per square into tuples of positions per square."""
+    return [tuple(positions(mask)) for mask in masks]
+
+
+# positions a piece can reach from every square on an empty board
+ROOK_MOVES = _position_table(ROOK_RAYS)
+BISHOP_MOVES = _position_table(BISHOP_RAYS)
+QUEEN_MOVES = _position_table(QUEEN_RAYS)
+KNIGHT_MOVES = _position_table(KNIGHT_ATTACKS)
+KING_MOVES = _position_table(KING_ATTACKS)
+PAWN_MOVES = {color: _position_table(masks) for color, masks in PAWN_PUSHES.items()}
+PAWN_CAPTURES = {color: _position_table(masks)
+                 for color, masks in PAWN_ATTACKS.items()}
+
+FILES = ('A', 'B', 'C', 'D', 'E', 'F', 'G', 'H')
+CASTLE_FIELDS = {'white': ((0, 2), (0, 6)), 'black': ((7, 2), (7, 6))}
 
 
 class ChessPiece(ABC):
-    """Keep state of chess piece."""
+    """Keep state of chess piece.
+
+    Pieces are created for every position that is set up, so they only
+    keep per-piece state in slots. Everything that follows from the kind of
+    piece is a class attribute.
+    """
+
+    __slots__ = ('_color', 'active', 'initial_position', 'n_moves')
+    short_name = None
+    may_jump = None
+    files = FILES
 
     def __init__(self, color, initial_position):
         """Initialize chess piece."""
@@ -14,58 +44,52 @@ class ChessPiece(ABC):
             raise ValueError("Unrecognized color!")
         self._color = color
         self.active = True
-        self.name = None
-        self.short_name = None
         self.initial_position = initial_position
-        self.files = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H']
-        self.may_jump = None
         self.n_moves = 0
 
     def __str__(self):
         """Display self."""
-        print(self._color + '_' + self.name)
+        return self._color + '_' + self.name
 
     @property
     def color(self):
         """Return color of piece."""
         return self._color
 
+    @property
+    def name(self):
+        """Return name of piece, prefixed by its initial file if not unique."""
+        return FILES[self.initial_position[1]] + '_' + type(self).__name__
+
 
 class Pawn(ChessPiece):
     """A pawn."""
 
+    __slots__ = ('en_passant', 'attacked_position')
+    short_name = 'p'
+    may_jump = False
+
     def __init__(self, color, initial_position):
         """Create pawn."""
         ChessPiece.__init__(self, color, initial_position)
-        initial_col = initial_position[1]
-        self.name = self.files[initial_col] + '_Pawn'
-        self.short_name = 'p'
-        self.may_jump = False
         self.en_passant = None
         self.attacked_position = None
-        if color == 'white':
-            self.direction = 1
-        else:
-            self.direction = -1
+
+    @property
+    def direction(self):
+        """Return the row step of the pawn."""
+        return 1 if self._color == 'white' else -1
 
     def valid_moves(self, position):
         """Return list of valid moves."""
-        row, col = position
-        moves = []
-        if on_board((row + self.direction, col)):
-            moves.append((row + self.direction, col))
+        moves = list(PAWN_MOVES[self._color][to_square(position)])
         if self.en_passant:
             moves.append(self.en_passant)
         return moves
 
     def valid_capture_moves(self, position):
         """Return list of valid capture moves."""
-        row, col = position
-        capture_moves = []
-        if on_board((row + self.direction, col - 1)):
-            capture_moves.append((row + self.direction, col - 1))
-        if on_board((row + self.direction, col + 1)):
-            capture_moves.append((row + self.direction, col + 1))
+        capture_moves = list(PAWN_CAPTURES[self._color][to_square(position)])
         if self.en_passant:
             capture_moves.append(self.en_passant)
         return capture_moves
@@ -91,23 +115,14 @@ class Pawn(ChessPiece):
 class Rook(ChessPiece):
     """A rook."""
 
-    def __init__(self, color, initial_position):
-        """Create rook."""
-        ChessPiece.__init__(self, color, initial_position)
-        initial_col = initial_position[1]
-        self.name = self.files[initial_col] + '_Rook'
-        self.short_name = 'R'
-        self.may_jump = False
+    __slots__ = ()
+    short_name = 'R'
+    may_jump = False
 
     @staticmethod
     def valid_moves(position):
         """Return list of valid moves."""
-        row, col = position
-        # add current column
-        moves = [(i, col) for i in range(8) if i != row]
-        # add current row
-        moves.extend([(row, i) for i in range(8) if i != col])
-        return moves
+        return list(ROOK_MOVES[to_square(position)])
 
     def valid_capture_moves(self, position):
         """Return list of valid capture moves."""
@@ -122,28 +137,14 @@ class Rook(ChessPiece):
 class Bishop(ChessPiece):
     """A bishop."""
 
-    def __init__(self, color, initial_position):
-        """Create bishop."""
-        ChessPiece.__init__(self, color, initial_position)
-        initial_col = initial_position[1]
-        self.name = self.files[initial_col] + '_Bishop'
-        self.short_name = 'B'
-        self.may_jump = False
+    __slots__ = ()
+    short_name = 'B'
+    may_jump = False
 
     @staticmethod
     def valid_moves(position):
         """Return list of valid moves."""
-        row, col = position
-        # add first diagonal
-        moves = [(row + i, col + i)
-                 for i in range(-min(row, col), min(8 - row, 8 - col))
-                 if i != 0]
-        # add second diagonal
-        moves.extend(
-            [(row + i, col - i)
-             for i in range(-min(row, 7 - col), min(8 - row, col + 1))
-             if i != 0])
-        return moves
+        return list(BISHOP_MOVES[to_square(position)])
 
     def valid_capture_moves(self, position):
         """Return a list of valid capture moves."""
@@ -158,25 +159,14 @@ class Bishop(ChessPiece):
 class Knight(ChessPiece):
     """A knight."""
 
-    def __init__(self, color, initial_position):
-        """Create knight."""
-        ChessPiece.__init__(self, color, initial_position)
-        initial_col = initial_position[1]
-        self.name = self.files[initial_col] + '_Knight'
-        self.short_name = 'N'
-        self.may_jump = True
+    __slots__ = ()
+    short_name = 'N'
+    may_jump = True
 
     @staticmethod
     def valid_moves(position):
         """Return list of valid moves."""
-        row, col = position
-        moves = [(row + i, col + j)
-                 for i in [-1, 1] for j in [-2, 2]
-                 if on_board((row + i, col + j))]
-        moves.extend([(row + i, col + j)
-                      for i in [-2, 2] for j in [-1, 1]
-                      if on_board((row + i, col + j))])
-        return moves
+        return list(KNIGHT_MOVES[to_square(position)])
 
     def valid_capture_moves(self, position):
         """Return list of valid capture moves."""
@@ -191,26 +181,20 @@ class Knight(ChessPiece):
 class King(ChessPiece):
     """The king."""
 
-    def __init__(self, color, initial_position):
-        """Create knight."""
-        ChessPiece.__init__(self, color, initial_position)
-        self.name = 'King'
-        self.short_name = 'K'
-        self.may_jump = False
-        if color == 'white':
-            self.castle_fields = [(0, 2), (0, 6)]
-        else:
-            self.castle_fields = [(7, 2), (7, 6)]
+    __slots__ = ()
+    short_name = 'K'
+    may_jump = False
+    name = 'King'
+
+    @property
+    def castle_fields(self):
+        """Return the fields the king moves to when castling."""
+        return CASTLE_FIELDS[self._color]
 
     @staticmethod
     def valid_moves(position):
         """Return list of valid moves."""
-        row, col = position
-        moves = [(row + i, col + j)
-                 for i in range(-min(1, row), min(2, 8 - row))
-                 for j in range(-min(1, col), min(2, 8 - col))
-                 if (i != 0 or j != 0)]
-        return moves
+        return list(KING_MOVES[to_square(position)])
 
     def valid_capture_moves(self, position):
         """Return list of valid capture moves."""
@@ -227,31 +211,15 @@ class King(ChessPiece):
 class Queen(ChessPiece):
     """The queen."""
 
-    def __init__(self, color, initial_position):
-        """Create queen."""
-        ChessPiece.__init__(self, color, initial_position)
-        self.name = 'Queen'
-        self.short_name = 'Q'
-        self.may_jump = False
+    __slots__ = ()
+    short_name = 'Q'
+    may_jump = False
+    name = 'Queen'
 
     @staticmethod
     def valid_moves(position):
         """Return list of valid moves."""
-        row, col = position
-        # add first diagonal
-        moves = [(row + i, col + i)
-                 for i in range(-min(row, col), min(8 - row, 8 - col))
-                 if i != 0]
-        # add second diagonal
-        moves.extend(
-            [(row + i, col - i)
-             for i in range(-min(row, 7 - col), min(8 - row, col + 1))
-             if i != 0])
-        # add current column
-        moves.extend([(i, col) for i in range(8) if i != row])
-        # add current row
-        moves.extend([(row, i) for i in range(8) if i != col])
-        return moves
+        return list(QUEEN_MOVES[to_square(position)])
 
     def valid_capture_moves(self, position):
         """Return a list of valid capture moves."""
@@ -1,19 +1,31 @@
 """Chess player."""
 
 from chesspiece import *
+from engine import SearchResult
 
 
 class ChessPlayer:
     """A chess player."""
 
-    def __init__(self, color):
-        """Setup chess player."""
+    def __init__(self, color, engine=None, pieces=None, book=None):
+        """Setup chess player.
+
+        A player with an ENGINE (see ``engine.Engine``) can choose its own
+        moves, taking them from the opening BOOK (see ``book.OpeningBook``)
+        while the position is in it. Given PIECES the player takes these
+        instead of setting up a new set of pieces.
+        """
         if color not in ['white', 'black']:
             raise ValueError("Unrecognized color!")
         self.color = color
+        self.engine = engine
+        self.book = book
         self.active_pieces = None
         self.captured_pieces = []
-        self.setup_pieces()
+        if pieces is None:
+            self.setup_pieces()
+        else:
+            self.active_pieces = list(pieces)
 
     def setup_pieces(self):
         """Initialize pieces."""
@@ -43,6 +55,19 @@ class ChessPlayer:
         # add queen
         self.active_pieces.append(Queen(self.color, (back_row, cols[3])))
 
+    def choose_move(self, board):
+        """Let the engine search a move, return the search result.
+
+        Book moves are played without a search.
+        """
+        if self.engine is None:
+            raise ValueError("Player has no engine!")
+        if self.book is not None:
+            move = self.book.choose(board)
+            if move is not None:
+                return SearchResult(move, 0, 0, [move], 0, 0.0)
+        return self.engine.search(board)
+
     def inactivate_piece(self, chess_piece):
         """Remove a captured piece."""
         self.active_pieces.remove(chess_piece)
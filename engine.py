@@ -0,0 +1,410 @@
+"""Alpha-beta chess engine."""
+
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from bitboard import RANK_1
+from chessmove import PROMOTION_CODES, PROMOTION_MASK, move_name
+from evaluation import evaluate
+from ordering import MoveOrderer
+from transposition import EXACT, LOWER, UPPER, TranspositionTable
+
+MATE_SCORE = 100000
+INFINITY = 1000000
+MAX_PLY = 128
+# pawns that promote with their next push
+PROMOTION_RANKS = {'white': RANK_1 << 48, 'black': RANK_1 << 8}
+QUEEN_PROMOTION = PROMOTION_CODES['Q'] << 12
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time budget is used up."""
+
+
+class SearchResult:
+    """Outcome of a search."""
+
+    def __init__(self, best_move, score, depth, pv, nodes, elapsed):
+        """Create result."""
+        self.best_move = best_move
+        self.score = score
+        self.depth = depth
+        self.pv = pv
+        self.nodes = nodes
+        self.elapsed = elapsed
+
+    @property
+    def nps(self):
+        """Return searched nodes per second."""
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        """Display self."""
+        return (f"depth {self.depth} score {self.score} nodes {self.nodes} "
+                f"nps {self.nps:.0f} pv {' '.join(move_name(m) for m in self.pv)}")
+
+
+class Engine:
+    """Negamax alpha-beta search with iterative deepening.
+
+    A search stops at DEPTH plies or when MOVETIME seconds have passed,
+    whichever comes first. The result of the last completed iteration is
+    returned. Results are kept in a transposition table of TABLE_SIZE_MB
+    megabytes that is reused by later searches. Moves are searched in the
+    order given by ORDERING (default: an ``ordering.MoveOrderer``).
+
+    With QUIESCENCE the leaves are not evaluated directly but only after
+    the captures on the board have been played out, see ``_quiescence``.
+    """
+
+    def __init__(self, depth=4, movetime=None, table_size_mb=16, ordering=None,
+                 quiescence=True):
+        """Create engine."""
+        self.depth = depth
+        self.movetime = movetime
+        self.table_size_mb = table_size_mb
+        self.quiescence = quiescence
+        self.table = TranspositionTable(table_size_mb)
+        self.ordering = ordering if ordering is not None else MoveOrderer(max_ply=MAX_PLY)
+        self.nodes = 0
+        self._deadline = None
+        self._pv = []
+        self._root_moves = None
+
+    def search(self, board, depth=None, movetime=None, root_moves=None,
+               window=(-INFINITY, INFINITY)):
+        """Search the best move for the side to move on BOARD.
+
+        With ROOT_MOVES only these moves are considered at the root. WINDOW
+        gives the (alpha, beta) bounds of the root search; if no move scores
+        above alpha the best move is None. If the time runs out before the
+        first iteration is done, the first ordered move is returned at
+        depth 0.
+        """
+        depth = depth or self.depth
+        movetime = movetime or self.movetime
+        start = time.perf_counter()
+        self._deadline = start + movetime if movetime else None
+        self.nodes = 0
+        self.table.new_search()
+        self.ordering.new_search()
+        self._root_moves = root_moves
+        base = len(board.undo_stack)
+
+        moves = self._ordered_moves(board, board.turn)
+        if root_moves is not None:
+            moves = [move for move in moves if move in root_moves]
+        result = SearchResult(moves[0] if moves else None, 0, 0, moves[:1], 0, 0.0)
+        for iteration_depth in range(1, depth + 1):
+            self._pv = [[] for _ in range(iteration_depth + 1)]
+            try:
+                score = self._negamax(board, iteration_depth, window[0], window[1], 0)
+            except SearchTimeout:
+                # take back the moves of the aborted iteration
+                while len(board.undo_stack) > base:
+                    board.unmake_move(board.undo_stack[-1])
+                break
+            pv = self._pv[0]
+            result = SearchResult(pv[0] if pv else None, score, iteration_depth,
+                                  pv, self.nodes, time.perf_counter() - start)
+            if abs(score) >= MATE_SCORE - iteration_depth:
+                # a forced mate was found
+                break
+        result.nodes = self.nodes
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    def _negamax(self, board, depth, alpha, beta, ply):
+        """Return the score of the position for the side to move."""
+        self.nodes += 1
+        # a look at the clock costs far less than a node
+        if self._deadline is not None and time.perf_counter() > self._deadline:
+            raise SearchTimeout()
+
+        self._pv[ply] = []
+        color = board.turn
+        if depth == 0:
+            if self.quiescence:
+                return self._quiescence(board, alpha, beta, ply)
+            return evaluate(board)
+
+        hash_move = None
+        entry = self.table.probe(board.hash)
+        if entry is not None:
+            hash_move, entry_depth, bound, score = entry
+            if ply > 0 and entry_depth >= depth:
+                score = score_from_table(score, ply)
+                if (bound == EXACT or bound == LOWER and score >= beta
+                        or bound == UPPER and score <= alpha):
+                    return score
+
+        moves = self._ordered_moves(board, color, hash_move, ply)
+        if ply == 0 and self._root_moves is not None:
+            moves = [move for move in moves if move in self._root_moves]
+        if not moves:
+            if board.in_check(color):
+                return -MATE_SCORE + ply
+            return 0
+
+        best_move = None
+        for move in moves:
+            undo_token = board.make_move(move)
+            score = -self._negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            board.unmake_move(undo_token)
+            if score > alpha:
+                alpha = score
+                best_move = move
+                self._pv[ply] = [move] + self._pv[ply + 1]
+                if alpha >= beta:
+                    self.ordering.cutoff(move, depth, ply)
+                    break
+
+        if alpha >= beta:
+            bound = LOWER
+        elif best_move is not None:
+            bound = EXACT
+        else:
+            bound = UPPER
+        self.table.store(board.hash, depth, score_to_table(alpha, ply), bound, best_move)
+        return alpha
+
+    def _quiescence(self, board, alpha, beta, ply):
+        """Return the score of the position once no good captures are left.
+
+        The side to move may stand pat on the static evaluation or play a
+        capture or queen promotion; captures that lose material by static
+        exchange evaluation are skipped. In check all evasions are searched.
+        """
+        self.nodes += 1
+        # a look at the clock costs far less than a node
+        if self._deadline is not None and time.perf_counter() > self._deadline:
+            raise SearchTimeout()
+
+        if ply >= MAX_PLY - 1:
+            return evaluate(board)
+        color = board.turn
+        in_check = board.in_check(color)
+        if in_check:
+            moves = list(board.generate_legal_moves(color))
+            if not moves:
+                return -MATE_SCORE + ply
+        else:
+            score = evaluate(board)
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+            moves = [move for move in board.generate_legal_moves(color, quiets=False)
+                     if move & PROMOTION_MASK in (0, QUEEN_PROMOTION)]
+            if board.bitboards[color]['p'] & PROMOTION_RANKS[color]:
+                moves += [move for move in board.generate_legal_moves(color, captures=False)
+                          if move & PROMOTION_MASK == QUEEN_PROMOTION]
+
+        for move in self.ordering.order(board, moves, None, ply):
+            if not in_check and board.see(move) < 0:
+                continue
+            undo_token = board.make_move(move)
+            score = -self._quiescence(board, -beta, -alpha, ply + 1)
+            board.unmake_move(undo_token)
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+        return alpha
+
+    def _ordered_moves(self, board, color, hash_move=None, ply=0):
+        """Return the legal moves of COLOR, the most promising first."""
+        return self.ordering.order(board, list(board.generate_legal_moves(color)),
+                                   hash_move, ply)
+
+
+class RandomEngine:
+    """Plays a random legal move, as a baseline opponent."""
+
+    def __init__(self, seed=None):
+        """Create engine, SEED makes the moves reproducible."""
+        self.random = random.Random(seed)
+
+    def search(self, board, depth=None, movetime=None, root_moves=None,
+               window=(-INFINITY, INFINITY)):
+        """Choose a random legal move for the side to move on BOARD."""
+        moves = list(board.generate_legal_moves(board.turn))
+        if root_moves is not None:
+            moves = [move for move in moves if move in root_moves]
+        if not moves:
+            return SearchResult(None, 0, 0, [], 0, 0.0)
+        move = self.random.choice(moves)
+        return SearchResult(move, 0, 1, [move], 1, 0.0)
+
+
+class ParallelEngine(Engine):
+    """Engine that splits the root moves over a pool of worker processes.
+
+    Per iteration the first root move is searched with a full window. All
+    other root moves are then searched in parallel with a null window
+    around its score, and the moves that turn out better are searched again
+    in parallel to get their exact score. Every search runs in a fresh
+    engine, so for a fixed depth the result does not depend on the number of
+    workers or on the order in which they finish. Ties are broken by the
+    order of the root moves.
+    """
+
+    def __init__(self, depth=4, movetime=None, table_size_mb=1, workers=None):
+        """Create engine with WORKERS processes (default: number of CPUs).
+
+        TABLE_SIZE_MB is the size of the transposition table of every search
+        in a worker; these tables are allocated per search, so keep them small.
+        """
+        Engine.__init__(self, depth, movetime, table_size_mb)
+        self.workers = workers
+        self._pool = None
+
+    def close(self):
+        """Shut down the worker processes."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        """Enter context."""
+        return self
+
+    def __exit__(self, *args):
+        """Exit context and shut down workers."""
+        self.close()
+
+    def search(self, board, depth=None, movetime=None, root_moves=None,
+               window=(-INFINITY, INFINITY)):
+        """Search the best move for the side to move on BOARD."""
+        depth = depth or self.depth
+        movetime = movetime or self.movetime
+        start = time.perf_counter()
+        deadline = time.time() + movetime if movetime else None
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers)
+        self.nodes = 0
+
+        moves = self._ordered_moves(board, board.turn)
+        if root_moves is not None:
+            moves = [move for move in moves if move in root_moves]
+        if not moves:
+            return Engine.search(self, board, 1, root_moves=root_moves)
+
+        result = SearchResult(moves[0], 0, 0, [moves[0]], 0, 0.0)
+        for iteration_depth in range(1, depth + 1):
+            iteration = self._search_iteration(board, moves, iteration_depth,
+                                               window, deadline)
+            if iteration is None:
+                break
+            result = iteration
+            # search the best move first in the next iteration
+            moves.remove(result.best_move)
+            moves.insert(0, result.best_move)
+            if abs(result.score) >= MATE_SCORE - iteration_depth:
+                break
+        result.nodes = self.nodes
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    def _search_iteration(self, board, moves, depth, window, deadline):
+        """Search MOVES to DEPTH, return the best result or None on timeout."""
+        # the board is sent to the workers in its compact pickled form
+        first = self._submit(board, [moves[0]], depth, window, deadline)
+        best = self._collect([first], depth)
+        if best is None:
+            return None
+        best = best[0]
+        alpha = max(best.score, window[0])
+        if alpha >= window[1]:
+            return best
+
+        tests = self._collect([self._submit(board, [move], depth, (alpha, alpha + 1),
+                                            deadline)
+                               for move in moves[1:]], depth)
+        if tests is None:
+            return None
+        better = [result.best_move for result in tests if result.best_move is not None]
+        researches = self._collect([self._submit(board, [move], depth,
+                                                 (alpha, window[1]), deadline)
+                                    for move in better], depth)
+        if researches is None:
+            return None
+        for result in researches:
+            if result.best_move is not None and result.score > best.score:
+                best = result
+        return best
+
+    def _submit(self, board, root_moves, depth, window, deadline):
+        """Start the search of ROOT_MOVES in a worker."""
+        return self._pool.submit(_search_root_moves, board, root_moves, depth,
+                                 window, deadline, self.table_size_mb)
+
+    def _collect(self, futures, depth):
+        """Wait for the searches, return their results or None on timeout."""
+        results = [future.result() for future in futures]
+        self.nodes += sum(result.nodes for result in results)
+        if any(result.depth < depth for result in results):
+            return None
+        return results
+
+
+def _search_root_moves(board, root_moves, depth, window, deadline, table_size_mb):
+    """Search ROOT_MOVES of BOARD in a worker process."""
+    movetime = None
+    if deadline is not None:
+        movetime = deadline - time.time()
+        if movetime <= 0:
+            return SearchResult(None, window[0], 0, [], 0, 0.0)
+    engine = Engine(depth, movetime, table_size_mb)
+    return engine.search(board, root_moves=root_moves, window=window)
+
+
+def parse_player(spec):
+    """Return the ``Engine`` settings of a player spec, None for 'random'.
+
+    A spec is 'random' or comma separated settings, e.g. 'depth=4' or
+    'depth=8,movetime=0.5'. With only a movetime the depth is unlimited.
+    """
+    if spec == 'random':
+        return None
+    settings = {}
+    for setting in spec.split(','):
+        name, _, value = setting.partition('=')
+        try:
+            if name == 'depth':
+                settings['depth'] = int(value)
+            elif name == 'movetime':
+                settings['movetime'] = float(value)
+            else:
+                raise ValueError()
+        except ValueError:
+            raise ValueError(f"Invalid player setting `{setting}`.") from None
+    if 'movetime' in settings and 'depth' not in settings:
+        settings['depth'] = MAX_PLY - 1
+    return settings
+
+
+def make_engine(spec, table_size_mb=16, seed=None):
+    """Create an engine from a player spec, see parse_player."""
+    settings = parse_player(spec)
+    if settings is None:
+        return RandomEngine(seed)
+    return Engine(table_size_mb=table_size_mb, **settings)
+
+
+def score_to_table(score, ply):
+    """Make a mate score relative to the node before storing it."""
+    if score >= MATE_SCORE - MAX_PLY:
+        return score + ply
+    if score <= -MATE_SCORE + MAX_PLY:
+        return score - ply
+    return score
+
+
+def score_from_table(score, ply):
+    """Make a stored mate score relative to the root again."""
+    if score >= MATE_SCORE - MAX_PLY:
+        return score - ply
+    if score <= -MATE_SCORE + MAX_PLY:
+        return score + ply
+    return score
@@ -0,0 +1,85 @@
+"""Static evaluation of chess positions.
+
+Positions are scored in centipawns by material and piece-square tables
+(the "simplified evaluation function" values).
+"""
+
+from bitboard import iter_squares
+
+PIECE_VALUES = {'p': 100, 'N': 320, 'B': 330, 'R': 500, 'Q': 900, 'K': 0}
+
+# piece-square tables from white's point of view, row 8 first
+PIECE_SQUARE_TABLES = {
+    'p': [0, 0, 0, 0, 0, 0, 0, 0,
+          50, 50, 50, 50, 50, 50, 50, 50,
+          10, 10, 20, 30, 30, 20, 10, 10,
+          5, 5, 10, 25, 25, 10, 5, 5,
+          0, 0, 0, 20, 20, 0, 0, 0,
+          5, -5, -10, 0, 0, -10, -5, 5,
+          5, 10, 10, -20, -20, 10, 10, 5,
+          0, 0, 0, 0, 0, 0, 0, 0],
+    'N': [-50, -40, -30, -30, -30, -30, -40, -50,
+          -40, -20, 0, 0, 0, 0, -20, -40,
+          -30, 0, 10, 15, 15, 10, 0, -30,
+          -30, 5, 15, 20, 20, 15, 5, -30,
+          -30, 0, 15, 20, 20, 15, 0, -30,
+          -30, 5, 10, 15, 15, 10, 5, -30,
+          -40, -20, 0, 5, 5, 0, -20, -40,
+          -50, -40, -30, -30, -30, -30, -40, -50],
+    'B': [-20, -10, -10, -10, -10, -10, -10, -20,
+          -10, 0, 0, 0, 0, 0, 0, -10,
+          -10, 0, 5, 10, 10, 5, 0, -10,
+          -10, 5, 5, 10, 10, 5, 5, -10,
+          -10, 0, 10, 10, 10, 10, 0, -10,
+          -10, 10, 10, 10, 10, 10, 10, -10,
+          -10, 5, 0, 0, 0, 0, 5, -10,
+          -20, -10, -10, -10, -10, -10, -10, -20],
+    'R': [0, 0, 0, 0, 0, 0, 0, 0,
+          5, 10, 10, 10, 10, 10, 10, 5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          0, 0, 0, 5, 5, 0, 0, 0],
+    'Q': [-20, -10, -10, -5, -5, -10, -10, -20,
+          -10, 0, 0, 0, 0, 0, 0, -10,
+          -10, 0, 5, 5, 5, 5, 0, -10,
+          -5, 0, 5, 5, 5, 5, 0, -5,
+          0, 0, 5, 5, 5, 5, 0, -5,
+          -10, 5, 5, 5, 5, 5, 0, -10,
+          -10, 0, 5, 0, 0, 0, 0, -10,
+          -20, -10, -10, -5, -5, -10, -10, -20],
+    'K': [-30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -20, -30, -30, -40, -40, -30, -30, -20,
+          -10, -20, -20, -20, -20, -20, -20, -10,
+          20, 20, 0, 0, 0, 0, 20, 20,
+          20, 30, 10, 0, 0, 10, 30, 20],
+}
+
+# material plus piece-square value per color, piece and square index
+SQUARE_VALUES = {
+    'white': {kind: [PIECE_VALUES[kind] + table[(7 - (sq >> 3)) * 8 + (sq & 7)]
+                     for sq in range(64)]
+              for kind, table in PIECE_SQUARE_TABLES.items()},
+    'black': {kind: [PIECE_VALUES[kind] + table[(sq >> 3) * 8 + (sq & 7)]
+                     for sq in range(64)]
+              for kind, table in PIECE_SQUARE_TABLES.items()},
+}
+
+
+def evaluate(board):
+    """Score the position in centipawns for the side to move."""
+    score = 0
+    for kind, mask in board.bitboards['white'].items():
+        values = SQUARE_VALUES['white'][kind]
+        for sq in iter_squares(mask):
+            score += values[sq]
+    for kind, mask in board.bitboards['black'].items():
+        values = SQUARE_VALUES['black'][kind]
+        for sq in iter_squares(mask):
+            score -= values[sq]
+    return score if board.turn == 'white' else -score
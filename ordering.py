@@ -0,0 +1,110 @@
+"""Move ordering for the search.
+
+Alpha-beta search prunes the most when the best move is searched first.
+``MoveOrderer`` sorts the moves of a node by:
+
+1. the move stored in the transposition table (hash move)
+2. captures, most valuable victim first, then least valuable attacker
+   (MVV-LVA)
+3. promotions
+4. killer moves: quiet moves that caused a cutoff at the same ply
+5. other quiet moves by their history score: how often, weighted by
+   depth, they caused a cutoff anywhere in the tree
+"""
+
+from chessmove import CAPTURE, EN_PASSANT, PROMOTION_MASK
+from evaluation import PIECE_VALUES
+
+HASH_MOVE_SCORE = 1 << 30
+CAPTURE_SCORE = 1 << 28
+PROMOTION_SCORE = 1 << 27
+KILLER_SCORE = 1 << 26
+# history scores are halved when one grows beyond this
+HISTORY_LIMIT = 1 << 20
+
+# value of the promotion piece per promotion code
+PROMOTION_VALUES = (0, PIECE_VALUES['N'], PIECE_VALUES['B'], PIECE_VALUES['R'],
+                    PIECE_VALUES['Q'])
+# MVV-LVA score per victim and attacker, the king attacks as the least
+# valuable piece since it only captures undefended pieces
+MVV_LVA = {victim: {attacker: PIECE_VALUES[victim] * 16 - PIECE_VALUES[attacker] // 10
+                    for attacker in PIECE_VALUES}
+           for victim in PIECE_VALUES}
+
+
+class MoveOrderer:
+    """Orders moves using the hash move, MVV-LVA, killers and history.
+
+    The heuristics can be switched off to measure their effect. One
+    orderer serves one search at a time.
+    """
+
+    def __init__(self, mvv_lva=True, killers=True, history=True, max_ply=128):
+        """Create orderer."""
+        self.use_mvv_lva = mvv_lva
+        self.use_killers = killers
+        self.use_history = history
+        self.max_ply = max_ply
+        # two killer moves per ply
+        self.killers = [[0, 0] for _ in range(max_ply)]
+        # score per from and to square, indexed by the low 12 bits of a move
+        self.history = [0] * 4096
+
+    def clear(self):
+        """Forget the killers and history, e.g. for a new game."""
+        self.killers = [[0, 0] for _ in range(self.max_ply)]
+        self.history = [0] * 4096
+
+    def new_search(self):
+        """Prepare for a new search, keeping half of the history."""
+        self.killers = [[0, 0] for _ in range(self.max_ply)]
+        self.history = [score >> 1 for score in self.history]
+
+    def order(self, board, moves, hash_move=None, ply=0):
+        """Return MOVES of the side to move on BOARD sorted best first."""
+        fields = board.board
+        killers = self.killers[ply] if self.use_killers else (0, 0)
+        history = self.history
+        use_mvv_lva = self.use_mvv_lva
+        use_history = self.use_history
+
+        def score(move):
+            if move == hash_move:
+                return HASH_MOVE_SCORE
+            if move & CAPTURE:
+                if not use_mvv_lva:
+                    return CAPTURE_SCORE
+                from_sq = move & 63
+                attacker = fields[from_sq >> 3][from_sq & 7].contents.short_name
+                if move & EN_PASSANT:
+                    victim = 'p'
+                else:
+                    to_sq = (move >> 6) & 63
+                    victim = fields[to_sq >> 3][to_sq & 7].contents.short_name
+                return (CAPTURE_SCORE + MVV_LVA[victim][attacker]
+                        + PROMOTION_VALUES[(move >> 12) & 7])
+            if move & PROMOTION_MASK:
+                return PROMOTION_SCORE + PROMOTION_VALUES[(move >> 12) & 7]
+            if move == killers[0]:
+                return KILLER_SCORE + 1
+            if move == killers[1]:
+                return KILLER_SCORE
+            if use_history:
+                return history[move & 4095]
+            return 0
+
+        return sorted(moves, key=score, reverse=True)
+
+    def cutoff(self, move, depth, ply):
+        """Learn from MOVE causing a beta cutoff at DEPTH remaining plies."""
+        if move & (CAPTURE | PROMOTION_MASK):
+            # captures and promotions are already ordered first
+            return
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        index = move & 4095
+        self.history[index] += depth * depth
+        if self.history[index] > HISTORY_LIMIT:
+            self.history = [score >> 1 for score in self.history]
@@ -0,0 +1,75 @@
+"""Perft move generation test and benchmark.
+
+Counts the leaf nodes of the legal move tree for a set of well known test
+positions and compares them with the published values. Run:
+
+    $ python perft.py --depth 3
+"""
+import argparse
+import sys
+import time
+
+from chessboard import ChessBoard
+
+# name, FEN and node counts for depth 1, 2, ...
+POSITIONS = [
+    ('startpos', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+     [20, 400, 8902, 197281, 4865609]),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     [48, 2039, 97862, 4085603]),
+    ('position3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     [14, 191, 2812, 43238, 674624]),
+    ('position4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     [6, 264, 9467, 422333]),
+    ('position5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     [44, 1486, 62379, 2103487]),
+    ('position6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+     [46, 2079, 89890, 3894594]),
+]
+
+
+def run(positions, max_depth, divide=False):
+    """Run perft on POSITIONS up to MAX_DEPTH, return number of failures."""
+    failures = 0
+    total_nodes = 0
+    total_time = 0.0
+    for name, fen, expected in positions:
+        board = ChessBoard.from_fen(fen)
+        print(f"{name}: {fen}")
+        for depth in range(1, min(max_depth, len(expected)) + 1):
+            start = time.perf_counter()
+            nodes = board.perft(depth)
+            elapsed = time.perf_counter() - start
+            total_nodes += nodes
+            total_time += elapsed
+            status = 'ok' if nodes == expected[depth - 1] else f'FAIL (expected {expected[depth - 1]})'
+            if nodes != expected[depth - 1]:
+                failures += 1
+            print(f"  depth {depth}: {nodes:>10} nodes {elapsed:9.3f} s "
+                  f"{nodes / max(elapsed, 1e-9):>10.0f} nps  {status}")
+        if divide:
+            for move, nodes in sorted(board.divide(max_depth).items()):
+                print(f"    {move}: {nodes}")
+    print(f"total: {total_nodes} nodes {total_time:.3f} s "
+          f"{total_nodes / max(total_time, 1e-9):.0f} nps")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--depth', type=int, default=3, help="maximum perft depth")
+    parser.add_argument('--position', choices=[name for name, _, _ in POSITIONS],
+                        help="only run a single position")
+    parser.add_argument('--divide', action='store_true',
+                        help="show node counts per root move at the maximum depth")
+    args = parser.parse_args()
+
+    positions = [p for p in POSITIONS if args.position in (None, p[0])]
+    failures = run(positions, args.depth, args.divide)
+    if failures:
+        print(f"{failures} perft count(s) do not match")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
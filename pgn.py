@@ -0,0 +1,206 @@
+"""Reading and writing games in Portable Game Notation (PGN).
+
+Games are read lazily, one at a time, so files of any size are processed in
+constant memory. The move text of a game is only split into moves when they
+are asked for and is replayed through a ``ChessBoard``:
+
+    for game in read_games('games.pgn'):
+        board = game.board()
+        for move in game.replay(board):
+            ...
+"""
+import mmap
+import re
+
+from chessboard import ChessBoard
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+# the seven tag roster, written first and in this order
+SEVEN_TAG_ROSTER = ('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result')
+LINE_LENGTH = 79
+
+TAG_PATTERN = re.compile(r'^\[\s*(\w+)\s+"(.*)"\s*\]')
+TOKEN_PATTERN = re.compile(r'\{[^}]*\}?|;[^\n]*|\$\d+|[()]|[^\s(){};$]+')
+MOVE_NUMBER_PATTERN = re.compile(r'^\d*\.*')
+ESCAPE_PATTERN = re.compile(r'\\(.)')
+
+
+class PGNGame:
+    """A game of a PGN file: its tags and its move text."""
+
+    def __init__(self, headers=None, movetext='', moves=None):
+        """Create game from HEADERS and either MOVETEXT or a list of SAN MOVES."""
+        self.headers = dict(headers or {})
+        self.movetext = movetext
+        self._moves = moves
+        self._result = None
+
+    @property
+    def moves(self):
+        """Return the moves of the main line in SAN."""
+        if self._moves is None:
+            self._moves, self._result = parse_movetext(self.movetext)
+        return self._moves
+
+    @property
+    def result(self):
+        """Return the result of the game, '*' if unknown."""
+        if self._moves is None:
+            self._moves, self._result = parse_movetext(self.movetext)
+        return self.headers.get('Result') or self._result or '*'
+
+    def board(self):
+        """Return a board with the starting position of the game."""
+        return ChessBoard.from_fen(self.headers.get('FEN', START_FEN))
+
+    def replay(self, board=None):
+        """Play the moves on BOARD and yield them as encoded moves.
+
+        Without BOARD the moves are played on a new board with the starting
+        position. Raises ValueError on an illegal or ambiguous move.
+        """
+        if board is None:
+            board = self.board()
+        for san in self.moves:
+            move = board.parse_san(san)
+            board.make_move(move)
+            yield move
+
+    @classmethod
+    def from_game(cls, game, headers=None):
+        """Record the moves played in a ``ChessGame``."""
+        board = ChessBoard.from_fen(game.start_fen)
+        moves = []
+        for move in game.history:
+            moves.append(board.san(move))
+            board.make_move(move)
+        headers = dict(headers or {})
+        if game.start_fen != START_FEN:
+            headers.setdefault('SetUp', '1')
+            headers.setdefault('FEN', game.start_fen)
+        if 'Result' not in headers:
+            headers['Result'] = game.result()
+        return cls(headers, moves=moves)
+
+    def __str__(self):
+        """Return the game in PGN export format."""
+        lines = []
+        headers = dict(self.headers)
+        for tag in SEVEN_TAG_ROSTER:
+            value = headers.pop(tag, '?' if tag != 'Result' else self.result)
+            lines.append(_tag_line(tag, value))
+        for tag, value in headers.items():
+            lines.append(_tag_line(tag, value))
+        lines.append('')
+
+        board = self.board()
+        move_number = board.fullmove_number
+        turn = board.turn
+        tokens = []
+        for index, san in enumerate(self.moves):
+            if turn == 'white':
+                tokens.append(f"{move_number}.")
+            elif index == 0:
+                tokens.append(f"{move_number}...")
+            tokens.append(san)
+            if turn == 'black':
+                move_number += 1
+            turn = 'black' if turn == 'white' else 'white'
+        tokens.append(self.result)
+
+        line = ''
+        for token in tokens:
+            if line and len(line) + 1 + len(token) > LINE_LENGTH:
+                lines.append(line)
+                line = token
+            else:
+                line = f"{line} {token}" if line else token
+        lines.append(line)
+        return '\n'.join(lines) + '\n'
+
+
+def parse_movetext(movetext):
+    """Split MOVETEXT into SAN moves of the main line and the result.
+
+    Comments, variations, numeric annotation glyphs and move numbers are
+    skipped.
+    """
+    moves = []
+    result = None
+    depth = 0
+    for token in TOKEN_PATTERN.findall(movetext):
+        first = token[0]
+        if first == '(':
+            depth += 1
+        elif first == ')':
+            depth -= 1
+        elif depth or first in '{;$':
+            continue
+        elif token in RESULTS:
+            result = token
+        else:
+            san = MOVE_NUMBER_PATTERN.sub('', token, 1)
+            if san:
+                moves.append(san)
+    return moves, result
+
+
+def read_games(source, encoding='utf-8'):
+    """Yield the games of a PGN SOURCE one by one.
+
+    SOURCE is a file name, which is memory-mapped, a file object opened in
+    text or binary mode or an ``mmap.mmap``. Only the game being read is
+    kept in memory.
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as pgn_file:
+            try:
+                mapped = mmap.mmap(pgn_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # an empty file can not be mapped
+                return
+            with mapped:
+                yield from read_games(mapped, encoding)
+        return
+
+    headers = {}
+    movetext = []
+    end = source.read(0)  # '' or b'' depending on the mode
+    for line in iter(source.readline, end):
+        if isinstance(line, bytes):
+            line = line.decode(encoding, 'replace')
+        if line.startswith('['):
+            if movetext:
+                yield PGNGame(headers, ''.join(movetext))
+                headers = {}
+                movetext = []
+            match = TAG_PATTERN.match(line)
+            if match is not None:
+                headers[match.group(1)] = ESCAPE_PATTERN.sub(r'\1', match.group(2))
+        elif line.startswith('%'):
+            # escaped line
+            continue
+        elif movetext or line.strip():
+            movetext.append(line)
+    if headers or movetext:
+        yield PGNGame(headers, ''.join(movetext))
+
+
+def write_games(destination, games):
+    """Write GAMES to a file name or text file object DESTINATION."""
+    if isinstance(destination, str):
+        with open(destination, 'w') as pgn_file:
+            write_games(pgn_file, games)
+        return
+    for index, game in enumerate(games):
+        if index:
+            destination.write('\n')
+        destination.write(str(game))
+
+
+def _tag_line(tag, value):
+    """Format a tag pair."""
+    value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'[{tag} "{value}"]'
+
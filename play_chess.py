@@ -1,82 +1,77 @@
 """Play chess in terminal."""
+import argparse
+import copy
 import sys
+import threading
+from collections import OrderedDict
 from enum import Enum, auto
 
 import pygame
-import json
 from pygame.locals import *
 from pygame import mixer
-from chessgame import ChessGame
-from time import sleep
+from assets import AssetManager, default_cache_dir
+from chessgame import ChessGame, GameLogger, GameState
+from engine import make_engine
 
 SCREEN_RECT = Rect(0, 0, 640, 640)
+# maximum number of pre-composed field tiles kept
+TILE_CACHE_SIZE = 256
+# the screen is redrawn at most this often per second
+MAX_FPS = 30
+# event posted by the engine thread with the move it found
+ENGINE_MOVE = pygame.USEREVENT
+# opacity of the highlight of the fields the selected piece can move to
+TARGET_ALPHA = 96
 
 
 class GameMode(Enum):
     SELECT_PIECE = auto()
     MAKE_MOVE = auto()
     PROMOTION = auto()
-
-
-def load_image(filename):
-    """Load an image into sdl surface."""
-    try:
-        surface = pygame.image.load(filename)
-    except pygame.error:
-        raise SystemExit("Could not load image \"%s\" %s" % (filename, pygame.get_error()))
-    return surface.convert_alpha()
+    # an engine failed to move, the game can not go on
+    STOPPED = auto()
 
 
 class ChessApp:
-    sprites = {}
-    sounds = {}
 
-    def __init__(self, theme="Theme1", window_style=0):
+    def __init__(self, theme="Theme1", window_style=0, cache_dir=None):
         self.game = None
+        self.logger = None
         mixer.pre_init(44100, -16, 1, 512)
         pygame.init()
         best_depth = pygame.display.mode_ok(SCREEN_RECT.size, window_style, 32)
         self.screen = pygame.display.set_mode(SCREEN_RECT.size, window_style, best_depth)
 
-        with open("img/themes.json", 'r') as fh:
-            theme_data = json.load(fh)
-
-        theme_data = theme_data[theme]
-
-        # chess board
-        self.sprites['board'] = load_image('img/' + theme_data['filename'])
-
-        # white pieces
-        self.sprites['K_white'] = load_image('img/king_white.png')
-        self.sprites['Q_white'] = load_image('img/queen_white.png')
-        self.sprites['B_white'] = load_image('img/bishop_white.png')
-        self.sprites['N_white'] = load_image('img/knight_white.png')
-        self.sprites['R_white'] = load_image('img/rook_white.png')
-        self.sprites['p_white'] = load_image('img/pawn_white.png')
-        self.sprites['DK_white'] = load_image('img/king_white_dead.png')
-
-        # black pieces
-        self.sprites['K_black'] = load_image('img/king_black.png')
-        self.sprites['Q_black'] = load_image('img/queen_black.png')
-        self.sprites['B_black'] = load_image('img/bishop_black.png')
-        self.sprites['N_black'] = load_image('img/knight_black.png')
-        self.sprites['R_black'] = load_image('img/rook_black.png')
-        self.sprites['p_black'] = load_image('img/pawn_black.png')
-        self.sprites['DK_black'] = load_image('img/king_black_dead.png')
-
-        self.sprites['Check'] = load_image('img/check.png')
-        self.sprites['Promotion'] = load_image('img/promotion.png')
-
-        self.white_highlight = theme_data['highlight_color_light']
-        self.black_highlight = theme_data['highlight_color_dark']
+        # composed field tiles by screen position and contents, least
+        # recently used first
+        self.tiles = OrderedDict()
+        # tile key shown per screen position
+        self.shown_tiles = {}
 
-        self.overlay = pygame.Surface(SCREEN_RECT.size, pygame.SRCALPHA)
+        # images and sounds are loaded when first needed and cached on disk
+        self.assets = AssetManager(cache_dir=cache_dir or default_cache_dir())
+        self.set_theme(theme)
 
         self.check = 0
         self.turn_board = False
         self.promotion_pieces = {0: 'Queen', 1: 'Rook', 2: 'Bishop', 3: 'Knight'}
         self.selected_promotion_piece = 0
-        self.sounds['move'] = mixer.Sound('snd/move.wav')
+
+        self.clock = pygame.time.Clock()
+        self.mode = GameMode.SELECT_PIECE
+        self.highlighted_fields = []
+        self.target_fields = set()
+        self.selected_field = None
+        self.engine_thread = None
+
+    def set_theme(self, theme):
+        """Use the board and highlight colors of THEME."""
+        theme_data = self.assets.theme(theme)
+        self.theme = theme
+        self.white_highlight = theme_data['highlight_color_light']
+        self.black_highlight = theme_data['highlight_color_dark']
+        # tiles of the theme are composed when first shown
+        self.invalidate()
 
     def get_rect(self, position):
         row, col = position
@@ -86,141 +81,227 @@ class ChessApp:
             pos_rect = Rect(col * 80, 560 - row * 80, 80, 80)
         return pos_rect
 
-    def draw_board(self, highlight_fields=None):
-        # get current setup
-        board = self.game.get_board()
-
-        # show checkerboard
-        self.screen.fill((255, 64, 64))
-        self.screen.blit(self.sprites['board'], Rect(0, 0, 640, 640))
-        self.overlay.fill((0, 0, 0, 0))
-
-        promotion = board.promotion
-        if promotion:
-            promotion_pos = promotion[1]
-            pos_rect = self.get_rect(promotion_pos)
-            self.overlay.blit(self.sprites['Promotion'], pos_rect)
+    def draw_board(self, highlight_fields=None, target_fields=()):
+        """Redraw the fields whose contents changed since the last call.
 
+        TARGET_FIELDS are highlighted more lightly than HIGHLIGHT_FIELDS.
+        """
+        board = self.game.get_board()
+        highlight_fields = set(highlight_fields or ())
+        promotion_pos = board.promotion[1] if board.promotion else None
+        king_position = None
         if self.check:
             # get current king position
             king_position = board.king_positions[self.game.current_player.color]
-        else:
-            king_position = None
-
-        # fill in highlighted fields
-        if highlight_fields is not None:
-            for field_pos in highlight_fields:
-                row, col = field_pos
-                field = board.get((row, col))
-                pos_rect = self.get_rect((row, col))
-                if field.color == 'white':
-                    self.overlay.fill(self.white_highlight,
-                                      pos_rect)
-                else:
-                    self.overlay.fill(self.black_highlight,
-                                      pos_rect)
-        self.screen.blit(self.overlay, (0, 0))
 
+        dirty_rects = []
         for row in range(board.col_size):
             for col in range(board.row_size):
                 field = board.get((row, col))
+                marker = sprite = None
                 if field.occupied:
                     piece = field.get()
-                    if self.turn_board and self.game.current_player.color == 'black':
-                        pos_rect = Rect(560 - col * 80, row * 80, 80, 80)
-                    else:
-                        pos_rect = Rect(col * 80, 560 - row * 80, 80, 80)
+                    sprite = piece.short_name + '_' + piece.color
                     if (row, col) == king_position:
-                        if self.check == 2:
-                            self.screen.blit(self.sprites['Check'],
-                                             pos_rect)
-                        elif self.check == 3:
-                            self.screen.blit(self.sprites['DK_' + piece.color],
-                                             pos_rect)
-                            continue
-                    self.screen.blit(self.sprites[piece.short_name + '_' + piece.color],
-                                     pos_rect)
-
-        pygame.display.flip()
-
-    def run(self):
-        """Initialize game."""
-        self.game = ChessGame()
+                        if self.check == GameState.CHECK:
+                            marker = 'Check'
+                        elif self.check == GameState.CHECKMATE:
+                            sprite = 'DK_' + piece.color
+                highlight = None
+                if (row, col) in highlight_fields:
+                    highlight = (self.white_highlight if field.color == 'white'
+                                 else self.black_highlight)
+                elif (row, col) in target_fields:
+                    highlight = (self.white_highlight if field.color == 'white'
+                                 else self.black_highlight)[:3] + [TARGET_ALPHA]
+                pos_rect = self.get_rect((row, col))
+                key = (self.theme, pos_rect.topleft, (row, col) == promotion_pos,
+                       tuple(highlight) if highlight else None, marker, sprite)
+                if self.shown_tiles.get(pos_rect.topleft) != key:
+                    self.screen.blit(self.get_tile(key, pos_rect), pos_rect)
+                    self.shown_tiles[pos_rect.topleft] = key
+                    dirty_rects.append(pos_rect)
+
+        if dirty_rects:
+            pygame.display.update(dirty_rects)
+
+    def get_tile(self, key, pos_rect):
+        """Return the field tile for KEY, composing it on first use."""
+        tile = self.tiles.get(key)
+        if tile is not None:
+            self.tiles.move_to_end(key)
+            return tile
+        _, _, promotion, highlight, marker, sprite = key
+        tile = self.assets.board(self.theme).subsurface(pos_rect).copy()
+        if promotion or highlight:
+            overlay = pygame.Surface(pos_rect.size, pygame.SRCALPHA)
+            if promotion:
+                overlay.blit(self.assets.sprite('Promotion'), (0, 0))
+            if highlight:
+                overlay.fill(highlight)
+            tile.blit(overlay, (0, 0))
+        if marker is not None:
+            tile.blit(self.assets.sprite(marker), (0, 0))
+        if sprite is not None:
+            tile.blit(self.assets.sprite(sprite), (0, 0))
+        tile = tile.convert()
+        self.tiles[key] = tile
+        if len(self.tiles) > TILE_CACHE_SIZE:
+            self.tiles.popitem(last=False)
+        return tile
+
+    def invalidate(self):
+        """Make the next draw_board redraw every field."""
+        self.shown_tiles.clear()
+
+    def run(self, engine_white=None, engine_black=None, book=None):
+        """Initialize game, players with an engine move by themselves."""
+        self.game = ChessGame(engine_white, engine_black, book=book)
+        self.logger = GameLogger()
+        self.logger.attach(self.game)
         self.draw_board()
         # show on screen
         self.wait_for_input()
 
     def wait_for_input(self):
-        """Get user input."""
-        board = self.game.get_board()
-        highlighted_fields = []
-        current_mode = GameMode.SELECT_PIECE
+        """Handle user input and engine moves until the window is closed.
+
+        The loop sleeps until an event arrives and redraws at most MAX_FPS
+        times per second. Engines search in a background thread and post
+        their move as an ENGINE_MOVE event.
+        """
+        self.mode = GameMode.SELECT_PIECE
+        self.highlighted_fields = []
+        self.start_engine_move()
 
         while True:
-            ev = pygame.event.get()
-            # proceed events
-            for event in ev:
-                # handle MOUSE BUTTON UP
-                pos = pygame.mouse.get_pos()
-
-                if event.type == pygame.MOUSEBUTTONDOWN:
-                    if current_mode == GameMode.PROMOTION:
-                        if event.button == 4:
-                            self.selected_promotion_piece = (self.selected_promotion_piece + 1) % 4
-                            self.game.choose_promotion(self.promotion_pieces[self.selected_promotion_piece])
-                        elif event.button == 5:
-                            self.selected_promotion_piece = (self.selected_promotion_piece - 1) % 4
-                            self.game.choose_promotion(self.promotion_pieces[self.selected_promotion_piece])
-                        elif event.button == 1:
-                            self.check = self.game.choose_promotion(
-                                self.promotion_pieces[self.selected_promotion_piece], final=True)
-                            current_mode = 0
-                            self.draw_board()
-                        self.draw_board()
-                    elif event.button == 1:
-                        inverted = self.turn_board and self.game.current_player.color == 'black'
-
-                if event.type == pygame.MOUSEBUTTONUP and event.button == 1:
-                    clicked_row, clicked_col = self.position_to_field(pos, inverted)
-                    field = board.get((clicked_row, clicked_col))
-                    if current_mode == GameMode.SELECT_PIECE:
-                        if field.occupied:
-                            piece = field.get()
-                            if piece.color == self.game.current_player.color:
-                                from_row = clicked_row
-                                from_col = clicked_col
-                                highlighted_fields.append((clicked_row, clicked_col))
-                                self.draw_board(highlighted_fields)
-                                current_mode = GameMode.MAKE_MOVE
-                    elif current_mode == GameMode.MAKE_MOVE:
-                        # deselect piece?
-                        if not (clicked_row == from_row and clicked_col == from_col):
-                            state = self.game.move((from_row, from_col),
-                                                   (clicked_row, clicked_col))
-                            if state == 0:
-                                raise ValueError("Not possible")
-                            else:
-                                self.sounds['move'].play()
-
-                            if state == 1:
-                                self.check = 0
-                            elif state == 4:
-                                # choose promotion
-                                current_mode = 2
-                                self.selected_promotion_piece = 0
-                                self.game.choose_promotion(self.promotion_pieces[self.selected_promotion_piece])
-                                highlighted_fields = []
-                                self.draw_board(highlighted_fields)
-                                continue
-                            else:
-                                self.check = state
-                        highlighted_fields = []
-                        current_mode = 0
-                        self.draw_board(highlighted_fields)
-
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
+            # sleep until something happens, then take all pending events
+            events = [pygame.event.wait()] + pygame.event.get()
+            redraw = False
+            for event in events:
+                if event.type == pygame.QUIT:
+                    pygame.quit()
+                    sys.exit()
+                elif event.type == pygame.VIDEOEXPOSE:
+                    # the window contents were lost
+                    self.invalidate()
+                    redraw = True
+                elif event.type == ENGINE_MOVE:
+                    self.engine_thread = None
+                    if event.move is None:
+                        self.logger.message(f"The {self.game.current_player.color} engine "
+                                            f"found no move, the game is stopped.")
+                        self.mode = GameMode.STOPPED
+                    else:
+                        self.play_engine_move(event.move)
+                        redraw = True
+                elif self.mode != GameMode.PROMOTION and (
+                        self.engine_thread is not None
+                        or self.game.current_player.engine is not None):
+                    # the engine is to move, ignore the mouse; a promotion is
+                    # chosen after the turn already passed to the engine
+                    continue
+                elif event.type == pygame.MOUSEBUTTONDOWN:
+                    redraw |= self.handle_button_down(event.button)
+                elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+                    redraw |= self.handle_click(event.pos)
+            if redraw:
+                self.draw_board(self.highlighted_fields, self.target_fields)
+                if self.game.current_player.engine is None:
+                    # generate the legal moves before the player clicks
+                    self.game.legal_targets()
+                self.start_engine_move()
+            self.clock.tick(MAX_FPS)
+
+    def handle_button_down(self, button):
+        """Choose the promotion piece, return True if the board changed."""
+        if self.mode != GameMode.PROMOTION:
+            return False
+        if button == 4:
+            self.selected_promotion_piece = (self.selected_promotion_piece + 1) % 4
+            self.game.choose_promotion(self.promotion_pieces[self.selected_promotion_piece])
+        elif button == 5:
+            self.selected_promotion_piece = (self.selected_promotion_piece - 1) % 4
+            self.game.choose_promotion(self.promotion_pieces[self.selected_promotion_piece])
+        elif button == 1:
+            self.check = self.game.choose_promotion(
+                self.promotion_pieces[self.selected_promotion_piece], final=True)
+            self.mode = GameMode.SELECT_PIECE
+        return True
+
+    def handle_click(self, pos):
+        """Select a piece or move it, return True if the board changed.
+
+        Clicks on fields the selected piece can not move to deselect it.
+        """
+        board = self.game.get_board()
+        inverted = self.turn_board and self.game.current_player.color == 'black'
+        clicked = self.position_to_field(pos, inverted)
+        if self.mode == GameMode.MAKE_MOVE and clicked in self.target_fields:
+            self.highlighted_fields = []
+            self.target_fields = set()
+            self.mode = GameMode.SELECT_PIECE
+            state = self.game.move(self.selected_field, clicked)
+            self.assets.sound('move').play()
+            if state == GameState.PROMOTION:
+                # choose promotion
+                self.mode = GameMode.PROMOTION
+                self.selected_promotion_piece = 0
+                self.game.choose_promotion(self.promotion_pieces[self.selected_promotion_piece])
+            else:
+                self.check = 0 if state == GameState.NORMAL else state
+            return True
+        if self.mode not in (GameMode.SELECT_PIECE, GameMode.MAKE_MOVE):
+            return False
+
+        field = board.get(clicked)
+        if (clicked != self.selected_field and field.occupied
+                and field.get().color == self.game.current_player.color):
+            # select the piece, or another one
+            self.selected_field = clicked
+            self.highlighted_fields = [clicked]
+            self.target_fields = self.game.legal_targets().get(clicked, set())
+            self.mode = GameMode.MAKE_MOVE
+            return True
+        if self.mode == GameMode.MAKE_MOVE:
+            # deselect piece
+            self.selected_field = None
+            self.highlighted_fields = []
+            self.target_fields = set()
+            self.mode = GameMode.SELECT_PIECE
+            return True
+        return False
+
+    def start_engine_move(self):
+        """Let the engine of the player to move search in the background."""
+        player = self.game.current_player
+        if (player.engine is None or self.engine_thread is not None
+                or self.mode in (GameMode.PROMOTION, GameMode.STOPPED)
+                or self.game.game_over()):
+            return
+        # the engine searches a copy, the board on screen stays untouched
+        board = copy.deepcopy(self.game.get_board())
+        self.engine_thread = threading.Thread(target=self._search, args=(player, board),
+                                              daemon=True)
+        self.engine_thread.start()
+
+    @staticmethod
+    def _search(player, board):
+        """Search a move of PLAYER in the engine thread and post it.
+
+        The move is None if the search found none or failed.
+        """
+        move = None
+        try:
+            move = player.choose_move(board).best_move
+        finally:
+            pygame.event.post(pygame.event.Event(ENGINE_MOVE, move=move))
+
+    def play_engine_move(self, move):
+        """Play a move found by an engine."""
+        state = self.game.play(move)
+        self.assets.sound('move').play()
+        self.check = 0 if state == GameState.NORMAL else state
 
     @staticmethod
     def position_to_field(pos, inverted):
@@ -234,7 +315,30 @@ class ChessApp:
         return row, col
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Play chess.")
+    parser.add_argument('--theme', default='Theme4', help="board theme, see img/themes.json")
+    parser.add_argument('--white', default='human',
+                        help="'human' or engine settings, e.g. 'depth=4'")
+    parser.add_argument('--black', default='human',
+                        help="'human' or engine settings, e.g. 'depth=4'")
+    parser.add_argument('--book', help="Polyglot opening book of the engines")
+    args = parser.parse_args()
+
+    engines = []
+    for spec in (args.white, args.black):
+        try:
+            engines.append(None if spec == 'human' else make_engine(spec))
+        except ValueError as error:
+            parser.error(str(error))
+    book = None
+    if args.book:
+        # the book module is only imported when it is used, to start faster
+        from book import OpeningBook
+        book = OpeningBook(args.book)
+    app = ChessApp(args.theme)
+    app.run(*engines, book)
+
+
 if __name__ == '__main__':
-    app = ChessApp("Theme4")
-    app.run()
-    sleep(10)
+    main()
@@ -0,0 +1,279 @@
+"""Headless engine tournament.
+
+Plays a match between two players on a pool of worker processes, writes
+the games to a PGN file and reports the score with an Elo estimate. The
+players alternate colors and play every opening with both colors. Run:
+
+    $ python tournament.py depth=3 random --games 100 --pgn games.pgn
+"""
+import argparse
+import contextlib
+import csv
+import itertools
+import math
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pgn
+from book import OpeningBook
+from chessgame import GAME_OVER, ChessGame
+from engine import make_engine, parse_player
+
+# two sided 95% confidence
+CONFIDENCE_Z = 1.96
+
+
+class GameRecord:
+    """Outcome of a tournament game."""
+
+    def __init__(self, index, white, black, result, termination, plies, pgn_text,
+                 nodes, elapsed):
+        """Create record.
+
+        NODES and ELAPSED are the searched nodes and search time per color.
+        """
+        self.index = index
+        self.white = white
+        self.black = black
+        self.result = result
+        self.termination = termination
+        self.plies = plies
+        self.pgn_text = pgn_text
+        self.nodes = nodes
+        self.elapsed = elapsed
+
+
+class TournamentStats:
+    """Score and search statistics of a match between two players."""
+
+    def __init__(self, players):
+        """Create statistics for the two PLAYERS."""
+        self.players = players
+        self.wins = 0
+        self.losses = 0
+        self.draws = 0
+        # per player, in the order of PLAYERS
+        self.nodes = [0, 0]
+        self.elapsed = [0.0, 0.0]
+        self.start = time.perf_counter()
+
+    @property
+    def games(self):
+        """Return number of finished games."""
+        return self.wins + self.losses + self.draws
+
+    def add(self, record):
+        """Count a finished game, scores are from the first player's view.
+
+        The first player has white in the even games, see ``run``.
+        """
+        colors = ('white', 'black') if record.index % 2 == 0 else ('black', 'white')
+        for player, color in enumerate(colors):
+            self.nodes[player] += record.nodes[color]
+            self.elapsed[player] += record.elapsed[color]
+        if record.result == '1/2-1/2':
+            self.draws += 1
+        elif (record.result == '1-0') == (colors[0] == 'white'):
+            self.wins += 1
+        else:
+            self.losses += 1
+
+    def report(self):
+        """Return a summary of the match."""
+        hours = (time.perf_counter() - self.start) / 3600
+        elo, margin = elo_difference(self.wins, self.losses, self.draws)
+        lines = [f"Score of {self.players[0]} vs {self.players[1]}: "
+                 f"{self.wins} - {self.losses} - {self.draws} ({self.games} games)",
+                 f"Elo difference: {elo:.1f} +/- {margin:.1f}",
+                 f"Games per hour: {self.games / hours if hours > 0 else 0:.0f}"]
+        for player, name in enumerate(self.players):
+            nps = (self.nodes[player] / self.elapsed[player]
+                   if self.elapsed[player] > 0 else 0)
+            lines.append(f"{name}: {self.nodes[player]} nodes {nps:.0f} nps")
+        return '\n'.join(lines)
+
+
+def elo_difference(wins, losses, draws):
+    """Return the Elo difference for a score and its 95% error margin."""
+    games = wins + losses + draws
+    if not games:
+        return 0.0, math.inf
+    score = (wins + draws / 2) / games
+    if score in (0, 1):
+        return _score_to_elo(score), math.inf
+    deviation = math.sqrt((wins * (1 - score) ** 2 + losses * score ** 2
+                           + draws * (0.5 - score) ** 2) / games)
+    error = CONFIDENCE_Z * deviation / math.sqrt(games)
+    low = _score_to_elo(score - error)
+    high = _score_to_elo(score + error)
+    return _score_to_elo(score), (high - low) / 2
+
+
+def _score_to_elo(score):
+    """Convert an expected score into an Elo difference."""
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return 400 * math.log10(score / (1 - score))
+
+
+def play_game(index, white, black, fen, max_plies, table_size_mb, seed, book_file=None):
+    """Play a game between the WHITE and BLACK player specs from FEN.
+
+    With BOOK_FILE both players take their moves from that opening book
+    while they can.
+    """
+    engines = {'white': make_engine(white, table_size_mb, seed),
+               'black': make_engine(black, table_size_mb, seed + 1)}
+    book = OpeningBook(book_file, seed) if book_file is not None else None
+    game = ChessGame.from_fen(fen, engines['white'], engines['black'], book)
+    nodes = {'white': 0, 'black': 0}
+    elapsed = {'white': 0.0, 'black': 0.0}
+    plies = 0
+    # color of a player that found no move
+    forfeit = None
+    while not game.game_over() and plies < max_plies:
+        color = game.current_player.color
+        result = game.current_player.choose_move(game.chessboard)
+        nodes[color] += result.nodes
+        elapsed[color] += result.elapsed
+        if result.best_move is None:
+            forfeit = color
+            break
+        game.play(result.best_move)
+        plies += 1
+    if book is not None:
+        book.close()
+
+    if forfeit is not None:
+        result = '0-1' if forfeit == 'white' else '1-0'
+        termination = 'forfeit'
+    elif game.state in GAME_OVER:
+        result = game.result()
+        termination = game.state.name.lower().replace('_', ' ')
+    else:
+        result = '1/2-1/2'
+        termination = 'adjudication'
+    headers = {'Event': 'Tournament', 'Site': '?', 'Date': time.strftime('%Y.%m.%d'),
+               'Round': str(index + 1), 'White': white, 'Black': black,
+               'Result': result, 'Termination': termination}
+    pgn_text = str(pgn.PGNGame.from_game(game, headers))
+    return GameRecord(index, white, black, result, termination, plies, pgn_text,
+                      nodes, elapsed)
+
+
+def load_openings(filename, plies=None):
+    """Return starting FENs from a PGN file or a file with a FEN per line.
+
+    Of PGN games the position after PLIES half moves (default: all moves)
+    is used.
+    """
+    if filename.endswith('.pgn'):
+        openings = []
+        for game in pgn.read_games(filename):
+            board = game.board()
+            for _ in itertools.islice(game.replay(board), plies):
+                pass
+            openings.append(board.to_fen())
+        return openings
+    with open(filename) as fen_file:
+        return [line.strip() for line in fen_file if line.strip()]
+
+
+def run(players, games, openings, workers=None, max_plies=400, table_size_mb=16,
+        seed=0, pgn_file=None, results_file=None, book_file=None):
+    """Play the match and return its statistics.
+
+    Game i starts from opening i // 2, the players switch colors every
+    game. Finished games are written to the open PGN_FILE and, as CSV rows,
+    to RESULTS_FILE. BOOK_FILE is an opening book for both players.
+    """
+    stats = TournamentStats(players)
+    writer = None
+    if results_file is not None:
+        writer = csv.writer(results_file)
+        writer.writerow(['round', 'white', 'black', 'result', 'termination', 'plies',
+                         'white_nodes', 'black_nodes', 'white_time', 'black_time'])
+    with ProcessPoolExecutor(workers) as pool:
+        # keep a bounded number of games queued
+        max_pending = 2 * (workers or os.cpu_count() or 1)
+        pending = set()
+        next_game = 0
+        while next_game < games or pending:
+            while next_game < games and len(pending) < max_pending:
+                white, black = players if next_game % 2 == 0 else players[::-1]
+                fen = openings[(next_game // 2) % len(openings)]
+                pending.add(pool.submit(play_game, next_game, white, black, fen,
+                                        max_plies, table_size_mb, seed + 2 * next_game,
+                                        book_file))
+                next_game += 1
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                record = future.result()
+                stats.add(record)
+                print(f"Game {record.index + 1}/{games}: {record.white} - "
+                      f"{record.black} {record.result} ({record.termination}, "
+                      f"{record.plies} plies)")
+                if pgn_file is not None:
+                    if stats.games > 1:
+                        pgn_file.write('\n')
+                    pgn_file.write(record.pgn_text)
+                    pgn_file.flush()
+                if writer is not None:
+                    writer.writerow([record.index + 1, record.white, record.black,
+                                     record.result, record.termination, record.plies,
+                                     record.nodes['white'], record.nodes['black'],
+                                     f"{record.elapsed['white']:.3f}",
+                                     f"{record.elapsed['black']:.3f}"])
+                    results_file.flush()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('players', nargs=2,
+                        help="player settings: 'random', 'depth=N', 'movetime=SECONDS' "
+                             "or both, e.g. 'depth=8,movetime=0.5'")
+    parser.add_argument('--games', type=int, default=10, help="number of games")
+    parser.add_argument('--workers', type=int, help="worker processes (default: CPUs)")
+    parser.add_argument('--fen', default=pgn.START_FEN, help="starting position")
+    parser.add_argument('--openings',
+                        help="PGN file or file with a FEN per line of starting positions")
+    parser.add_argument('--opening-plies', type=int,
+                        help="half moves of the PGN openings to play")
+    parser.add_argument('--book', help="Polyglot opening book of the engines")
+    parser.add_argument('--max-plies', type=int, default=400,
+                        help="adjudicate longer games as draws")
+    parser.add_argument('--hash', type=int, default=16,
+                        help="transposition table size in MB")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the random players")
+    parser.add_argument('--pgn', help="write the games to this PGN file")
+    parser.add_argument('--results', help="write the game results to this CSV file")
+    args = parser.parse_args()
+
+    for spec in args.players:
+        try:
+            parse_player(spec)
+        except ValueError as error:
+            parser.error(str(error))
+    openings = [args.fen]
+    if args.openings:
+        openings = load_openings(args.openings, args.opening_plies)
+        if not openings:
+            parser.error(f"No openings in {args.openings}")
+
+    with contextlib.ExitStack() as stack:
+        pgn_file = results_file = None
+        if args.pgn:
+            pgn_file = stack.enter_context(open(args.pgn, 'w'))
+        if args.results:
+            results_file = stack.enter_context(open(args.results, 'w', newline=''))
+        stats = run(args.players, args.games, openings, args.workers, args.max_plies,
+                    args.hash, args.seed, pgn_file, results_file, args.book)
+    print(stats.report())
+
+
+if __name__ == '__main__':
+    main()
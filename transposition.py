@@ -0,0 +1,83 @@
+"""Transposition table for the search.
+
+The table has a fixed size and stores its entries in two preallocated
+arrays of 64-bit words, one for the position keys and one for the packed
+entry data. Entries are grouped in buckets of two slots: the first slot
+keeps the deepest result (depth-preferred), the second slot is always
+replaced.
+"""
+
+from array import array
+
+EXACT = 1
+LOWER = 2
+UPPER = 3
+
+ENTRY_SIZE = 16
+
+# bit layout of the data word
+_MOVE_MASK = (1 << 19) - 1
+_DEPTH_SHIFT = 19
+_BOUND_SHIFT = 27
+_SCORE_SHIFT = 29
+_SCORE_OFFSET = 1 << 19
+_AGE_SHIFT = 49
+
+
+class TranspositionTable:
+    """Fixed size hash table of search results keyed by position hash."""
+
+    def __init__(self, size_mb=16):
+        """Allocate a table of SIZE_MB megabytes."""
+        n_entries = max(2, int(size_mb * 1024 * 1024) // ENTRY_SIZE)
+        self.n_buckets = n_entries // 2
+        self.keys = array('Q', [0]) * (2 * self.n_buckets)
+        self.data = array('Q', [0]) * (2 * self.n_buckets)
+        self.age = 0
+
+    def clear(self):
+        """Remove all entries."""
+        size = len(self.keys)
+        self.keys = array('Q', [0]) * size
+        self.data = array('Q', [0]) * size
+        self.age = 0
+
+    def new_search(self):
+        """Mark the entries of earlier searches as replaceable."""
+        self.age = (self.age + 1) & 0xFF
+
+    def probe(self, key):
+        """Return (move, depth, bound, score) stored for KEY, or None."""
+        index = (key % self.n_buckets) << 1
+        keys = self.keys
+        if keys[index] == key:
+            data = self.data[index]
+        elif keys[index + 1] == key:
+            data = self.data[index + 1]
+        else:
+            return None
+        if not data:
+            return None
+        return (data & _MOVE_MASK, (data >> _DEPTH_SHIFT) & 0xFF,
+                (data >> _BOUND_SHIFT) & 3,
+                ((data >> _SCORE_SHIFT) & 0xFFFFF) - _SCORE_OFFSET)
+
+    def store(self, key, depth, score, bound, move):
+        """Store a search result for the position with hash KEY."""
+        index = (key % self.n_buckets) << 1
+        data = self.data[index]
+        if (self.keys[index] != key and data
+                and (data >> _AGE_SHIFT) == self.age
+                and (data >> _DEPTH_SHIFT) & 0xFF > depth):
+            # keep the deeper result, use the always-replace slot
+            index += 1
+        self.keys[index] = key
+        self.data[index] = ((move or 0) | depth << _DEPTH_SHIFT
+                            | bound << _BOUND_SHIFT
+                            | (score + _SCORE_OFFSET) << _SCORE_SHIFT
+                            | self.age << _AGE_SHIFT)
+
+    def hashfull(self):
+        """Return the permille of used slots among the first thousand."""
+        sample = self.data[:1000]
+        return sum(1 for data in sample if data) * 1000 // len(sample)